@@ -21,6 +21,14 @@ class Allocator:
 		data = mmap_object.read(size)
 		return data
 
+	def read_into(self, file, offset, buffer):
+		# copy straight from the mapping into a reusable buffer, returns the amount read
+		mmap_object = self.files[file]
+		size = max(0, min(len(buffer), len(mmap_object) - offset))
+		with memoryview(mmap_object) as view:
+			buffer[:size] = view[offset:offset+size]
+		return size
+
 	def free_mem(self):
 		for file in list(self.files.keys()):
 			self.files[file].close()
@@ -4,9 +4,11 @@ import json
 import math
 import time
 import extract
+import mapfilter
 import platform
 import urllib
 import webbrowser
+import multiprocessing
 from PyQt5 import uic
 from requests import get
 from PyQt5.QtGui import QTextCursor
@@ -53,6 +55,9 @@ class BackgroundWorker(QObject):
 			self.files = data["files"]
 			self.format = data["format"]
 			self.output = data["output"]
+		if action == "metadata":
+			self.files = data["files"]
+			self.stopped = False
 
 	def run(self):
 		if self.action == "load":
@@ -71,6 +76,15 @@ class BackgroundWorker(QObject):
 			print(f"Extracting {len(self.files)} files...")
 			self.extract.extract_files(self.input, self.files, self.output, self.format, progress=self.progress.emit)
 			self.finished.emit({"action": "extract"})
+		if self.action == "metadata":
+			# headers are parsed a chunk at a time so the tree can follow
+			for start in range(0, len(self.files), 256):
+				if self.stopped:
+					break
+				chunk = self.files[start:start+256]
+				self.extract.fill_metadata(chunk)
+				self.progress.emit(chunk)
+			self.finished.emit({"action": "metadata"})
 
 class UpdaterWorker(QObject):
 	finished = pyqtSignal(bool)
@@ -111,6 +125,8 @@ class UpdaterWorker(QObject):
 					if os.path.isfile(name):
 						os.remove(name)
 					os.rename("maps/temp.map", name)
+					# filter used by auto detection, rebuilt later anyway if this fails
+					mapfilter.get_filter(name)
 
 					# update index
 					currentMaps["maps"][i]["version"] = latest["version"]
@@ -189,9 +205,14 @@ class AnimeWwise(QMainWindow):
 		}
 		self.format = "wav"
 		self.fileStructure = {"folders": {}, "files": []}
+		self.bankItems = {}
+		# file items still waiting for their metadata, both ways
+		self.pendingItems = {}
+		self.metadataItems = {}
+		self.metadataWorker = None
+		self.extract = extract.WwiseExtract()
 		self.setupActions()
 		sys.stdout = TextEditStream(self.console)
-		self.extract = extract.WwiseExtract()
 		self.checkUpdates()
 		self.totalProgress.setMaximum(10000)
 		self.fileProgress.setMaximum(10000)
@@ -242,7 +263,7 @@ class AnimeWwise(QMainWindow):
 		self.pckLoadTypeCombo.currentIndexChanged.connect(self.loadTypeChange)
 		self.loadType = "folder"
 
-		self.assetMap.addItems(["No map", *[f'{e["game"]} - v{e["version"]}' for e in self.maps]])
+		self.assetMap.addItems(["No map", "Auto detect", *[f'{e["game"]} - v{e["version"]}' for e in self.maps]])
 
 		self.setExtractionState(False)
 
@@ -253,8 +274,17 @@ class AnimeWwise(QMainWindow):
 		self.actionReset.triggered.connect(lambda: self.resetApp())
 		self.actionExit.triggered.connect(lambda: self.close())
 
-		self.actionExpand_all.triggered.connect(lambda: self.treeWidget.expandAll())
+		self.actionExpand_all.triggered.connect(lambda: self.expandAll())
+		self.treeWidget.itemExpanded.connect(self.expandBank)
 		self.actionCollapse_all.triggered.connect(lambda: self.treeWidget.collapseAll())
+		self.treeWidget.itemExpanded.connect(self.showItem)
+
+		# metadata mode
+		self.actionLazy_metadata = QAction("Load metadata on demand", self)
+		self.actionLazy_metadata.setCheckable(True)
+		self.actionLazy_metadata.setChecked(self.extract.lazy_metadata)
+		self.actionLazy_metadata.toggled.connect(lambda state: setattr(self.extract, "lazy_metadata", state))
+		self.menuView.addAction(self.actionLazy_metadata)
 
 		self.actionExtract_Selected.triggered.connect(lambda: self.extractItems(False))
 		self.actionExtract_All.triggered.connect(lambda: self.extractItems(True))
@@ -308,6 +338,14 @@ class AnimeWwise(QMainWindow):
 		self.actionExpand_all.setEnabled(state)
 		self.actionCollapse_all.setEnabled(state)
 
+	def displayDuration(self, file_meta):
+		# metadata is None until parsed in lazy mode, False when the header can't be read
+		if file_meta["metadata"] is None:
+			return "..."
+		if file_meta["metadata"] is False:
+			return "unreadable"
+		return f'{round(file_meta["metadata"]["duration"], 1)} seconds'
+
 	def displaySize(self, size):
 		if size < 1024:
 			return f"{size} b"
@@ -329,6 +367,13 @@ class AnimeWwise(QMainWindow):
 			self.fileProgress.setValue(progress_value)
 			self.fileProgress.setFormat("%.02f %%" % (progress_value / 100)) 
 
+	@pyqtSlot(list)
+	def metadataSlot(self, files):
+		for file_meta in files:
+			for item in self.metadataItems.pop(id(file_meta), []):
+				self.pendingItems.pop(item, None)
+				item.setText(1, self.displayDuration(file_meta))
+
 	@pyqtSlot(dict)
 	def handleFinished(self, data):
 		if data["action"] == "load":
@@ -338,6 +383,10 @@ class AnimeWwise(QMainWindow):
 			self.setExtractionState(True)
 			self.tabs.setCurrentIndex(1)
 			print("Done !")
+			if self.extract.lazy_metadata:
+				self.loadMetadata()
+		if data["action"] == "metadata" and self.sender() is self.metadataWorker:
+			self.metadataWorker = None
 		if data["action"] == "error":
 			QMessageBox.warning(None, "Warning", data["content"]["msg"], QMessageBox.Ok)
 			state = data["content"]["state"]
@@ -376,8 +425,10 @@ class AnimeWwise(QMainWindow):
 			self.currentInput = os.path.dirname(path[0])
 
 		_map = self.assetMap.currentIndex()
-		if _map != 0:
-			_map = self.maps[_map-1]["name"]
+		if _map == 1:
+			_map = extract.AUTO_MAP
+		elif _map != 0:
+			_map = self.maps[_map-2]["name"]
 		else:
 			_map = None
 
@@ -397,6 +448,42 @@ class AnimeWwise(QMainWindow):
 		self.backgroundWorker.progress.connect(self.progressBarSlot)
 		self.backgroundThread.start()
 
+	def loadMetadata(self):
+		# fill every file loaded without metadata in the background, banks are filled when opened
+		files = []
+		stack = [self.fileStructure]
+
+		while stack:
+			node = stack.pop()
+			files.extend([f[1] for f in node["files"] if f[1]["metadata"] is None])
+			stack.extend(node["folders"].values())
+
+		if len(files) == 0:
+			return
+
+		if self.metadataWorker is not None:
+			self.metadataWorker.stopped = True
+
+		# parented so a previous thread still finishing its chunk isn't destroyed here
+		self.metadataThread = QThread(self)
+		self.metadataWorker = BackgroundWorker("metadata", self.extract, {"files": files})
+		self.metadataWorker.moveToThread(self.metadataThread)
+		self.metadataThread.started.connect(self.metadataWorker.run)
+		self.metadataWorker.finished.connect(self.handleFinished)
+		self.metadataWorker.finished.connect(self.metadataThread.quit)
+		self.metadataWorker.finished.connect(self.metadataWorker.deleteLater)
+		self.metadataThread.finished.connect(self.metadataThread.deleteLater)
+
+		self.metadataWorker.progress.connect(self.metadataSlot)
+		self.metadataThread.start()
+
+	def fillMetadata(self, files):
+		# parse right away what the background worker didn't reach yet
+		pending = [e for e in files if e["metadata"] is None]
+		if len(pending) > 0:
+			self.extract.fill_metadata(pending)
+			self.metadataSlot(pending)
+
 	# page 2 - browsing
 	def filterAsset(self):
 		search = self.searchAsset.text()
@@ -426,18 +513,24 @@ class AnimeWwise(QMainWindow):
 
 	def resetTreeWidget(self):
 		self.treeWidget.clear()
+		self.bankItems.clear()
+		self.pendingItems.clear()
+		self.metadataItems.clear()
 		self.fileStructure = {"folders": {}, "files": []}
 		self.audioInfoLabel.setText("Click on an audio file to get more infos !")
 		self.setExtractionState(False)
 
 	def updateTreeWidget(self, structure):
 		self.treeWidget.clear()
+		self.bankItems.clear()
+		self.pendingItems.clear()
+		self.metadataItems.clear()
 		self.treeWidget.setColumnCount(4)
 		self.treeWidget.setHeaderLabels(["Name", "Duration", "Compressed Size", "Source", "Offset"])
 		
 		self.addItems(None, structure)
 
-		self.treeWidget.expandAll()
+		self.expandAll()
 
 		self.treeWidget.header().setSectionResizeMode(0, QHeaderView.ResizeToContents)
 		self.treeWidget.header().setSectionResizeMode(1, QHeaderView.Stretch)
@@ -450,8 +543,44 @@ class AnimeWwise(QMainWindow):
 		self.treeWidget.setDragDropMode(QAbstractItemView.NoDragDrop)
 		self.treeWidget.itemClicked.connect(self.updateAudioPreview)
 
+	def expandAll(self):
+		# collapsed banks must stay collapsed, expanding them all would defeat lazy loading
+		self.treeWidget.blockSignals(True)
+		self.treeWidget.expandAll()
+		for item in self.bankItems:
+			item.setExpanded(False)
+		self.treeWidget.blockSignals(False)
+
+	def expandBank(self, item):
+		node = self.bankItems.pop(item, None)
+		if node is None:
+			return
+
+		checked = item.checkState(0) == Qt.Checked
+		self.extract.expand_bank(node)
+
+		item.takeChildren()
+		self.addItems(item, node)
+		item.setText(2, self.displaySize(self.computeFolderSize(node)))
+
+		# new children don't inherit the check state of a checked bank
+		if checked:
+			stack = [item.child(i) for i in range(item.childCount())]
+			while stack:
+				child = stack.pop()
+				child.setCheckState(0, Qt.Checked)
+				stack.extend([child.child(i) for i in range(child.childCount())])
+
+	def showItem(self, item):
+		# files become visible when their folder is opened
+		children = [item.child(i) for i in range(item.childCount())]
+		self.fillMetadata([self.pendingItems[e] for e in children if e in self.pendingItems])
+
 	def computeFolderSize(self, folder):
 		total_size = 0
+
+		if "bank" in folder and not folder["bank"]["loaded"]:
+			return folder["bank"]["size"]
 		
 		for file in folder.get("files", []):
 			total_size += file[1]["size"]
@@ -469,8 +598,13 @@ class AnimeWwise(QMainWindow):
 			self.audioInfoLabel.setText("Click on an audio file to get more infos !")
 			return
 
+		self.fillMetadata([file_data["files"][0][1]])
 		meta = file_data["files"][0][1]["metadata"]
 
+		if meta is False:
+			self.audioInfoLabel.setText(f"Infos for {item.text(0)} => unreadable header")
+			return
+
 		# show meta
 		text = f'Infos for {item.text(0)} => Channels : {meta["channels"]} | Sample rate : {meta["sampleRate"]} Hz | Bitrate : {meta["avgBitrate"]} kbps | Codec : {meta["codecDisplay"]} | Layout type : {meta["layoutType"]}'
 		self.audioInfoLabel.setText(text)
@@ -485,13 +619,23 @@ class AnimeWwise(QMainWindow):
 				self.treeWidget.addTopLevelItem(folder_item)
 			else:
 				parent.addChild(folder_item)
+
+			if "bank" in folder_content and not folder_content["bank"]["loaded"]:
+				# placeholder child so the bank can be expanded
+				folder_item.addChild(QTreeWidgetItem(["Loading...", "", "", "", ""]))
+				self.bankItems[folder_item] = folder_content
+				continue
+
 			self.addItems(folder_item, folder_content)
 
 		for file in sorted(element.get("files", []), key=lambda x: x[0]):
 			file_meta = file[1]
-			file_item = QTreeWidgetItem([file[0], f'{round(file_meta["metadata"]["duration"], 1)} seconds', self.displaySize(file_meta["size"]), file_meta["source"], str(hex(file_meta["offset"]))])
+			file_item = QTreeWidgetItem([file[0], self.displayDuration(file_meta), self.displaySize(file_meta["size"]), file_meta["source"], str(hex(file_meta["offset"]))])
 			file_item.setFlags(file_item.flags() | Qt.ItemIsUserCheckable)
 			file_item.setCheckState(0, Qt.Unchecked)
+			if file_meta["metadata"] is None:
+				self.pendingItems[file_item] = file_meta
+				self.metadataItems.setdefault(id(file_meta), []).append(file_item)
 			if parent is None:
 				self.treeWidget.addTopLevelItem(file_item)
 			else:
@@ -501,6 +645,11 @@ class AnimeWwise(QMainWindow):
 	def extractItems(self, _all):
 		self.setFolder(folder="output")
 
+		# selected banks that were never opened must be expanded first
+		for item in list(self.bankItems.keys()):
+			if _all or item.checkState(0) != Qt.Unchecked:
+				self.expandBank(item)
+
 		# meta
 		self.meta_index = {}
 		stack = [self.fileStructure]
@@ -560,6 +709,8 @@ class AnimeWwise(QMainWindow):
 
 	# misc
 	def resetApp(self):
+		if self.metadataWorker is not None:
+			self.metadataWorker.stopped = True
 		self.resetTreeWidget()
 		self.extract.reset()
 		self.currentInput = None
@@ -577,6 +728,7 @@ class AnimeWwise(QMainWindow):
 		self.console.ensureCursorVisible()
 
 if __name__ == "__main__":
+	multiprocessing.freeze_support() # workers re-enter here when frozen
 	app = QApplication(sys.argv)
 	window = AnimeWwise()
 	window.show()
@@ -0,0 +1,273 @@
+# micro benchmarks for the parsing and decoding hot paths
+# usage: python benchmark.py [--json out.json] [--baseline base.json] [--threshold 10] [--filter name]
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import argparse
+import tracemalloc
+
+import vfs
+import bnk
+import wwise
+import wavescan
+import extract
+import mapcompiler
+from mapper import Mapper, CompiledMapper
+from filereader import FileReader, BufferReader
+from synth import make_wem, make_bnk, make_akpk, generate_install
+
+BENCH_VERSION = 1
+MAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "maps", "beyond.map")
+
+### runner ###
+
+def quiet(func, *args):
+	# the loaders print progress, keep it out of the report
+	stdout = sys.stdout
+	try:
+		sys.stdout = io.StringIO()
+		return func(*args)
+	finally:
+		sys.stdout = stdout
+
+def measure(func, nbytes=0, min_time=0.5):
+	# ops/sec over at least min_time, then one traced run for peak allocations
+	func()
+	runs = 0
+	start = time.perf_counter()
+	while True:
+		func()
+		runs += 1
+		elapsed = time.perf_counter() - start
+		if elapsed >= min_time:
+			break
+
+	tracemalloc.start()
+	func()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	ops = runs / elapsed
+	return {
+		"ops": ops,
+		"mbps": ops * nbytes / 0x100000 if nbytes else None,
+		"peak_kb": peak / 1024
+	}
+
+def benchmarks(work_dir):
+	cases = {}
+
+	# readers
+	table = random.Random(1).randbytes(4 * 0x4000)
+
+	def file_reader():
+		reader = FileReader(io.BytesIO(table), "little")
+		for i in range(0x4000):
+			reader.ReadUInt32()
+
+	def buffer_reader():
+		reader = BufferReader(table, "little")
+		for i in range(0x4000):
+			reader.ReadUInt32()
+
+	cases["filereader.read_uint32"] = (file_reader, len(table))
+	cases["bufferreader.read_uint32"] = (buffer_reader, len(table))
+
+	# package scan
+	small = make_wem(data_size=0x40)
+	package = make_akpk([(i, small, i & 1) for i in range(0x2000)], externals=[((1 << 40) + i, small, 0) for i in range(0x800)])
+	cases["wavescan.extract_sector"] = (lambda: wavescan.get_data(package, "bench.pck"), len(package))
+
+	# banks
+	bank = make_bnk([(i, small) for i in range(0x1000)])
+	cases["bnk.bnk2wem"] = (lambda: bnk.bnk2wem(bank, "bench.bnk"), len(bank))
+
+	# wem headers
+	for codec in ["PTADPCM", "VORBIS"]:
+		wem = make_wem(codec, 0x40000)
+		cases[f"wwise.parse_wwise.{codec.lower()}"] = (lambda wem=wem: wwise.parse_wwise(wem, "bench", "1.wem"), len(wem))
+
+	encrypted = bytearray(make_wem("PTADPCM", 0x40000))
+	vfs.decrypt(encrypted, 0, len(encrypted), 1234, 0)
+	encrypted = bytes(encrypted)
+	cases["wwise.parse_wwise.encrypted"] = (lambda: wwise.parse_wwise(encrypted, "bench", "1234.wem"), len(encrypted))
+
+	# keystream
+	buffer = bytearray(random.Random(2).randbytes(0x100000))
+	cases["vfs.decrypt"] = (lambda: vfs.decrypt(buffer, 1, len(buffer) - 2, 1234, 3), len(buffer))
+	small_buffer = bytearray(buffer[:0x4000])
+	cases["vfs.decrypt_python"] = (lambda: vfs.decrypt_python(small_buffer, 1, len(small_buffer) - 2, 1234, 3), len(small_buffer))
+
+	# mapping
+	if os.path.isfile(MAP_PATH):
+		mapper = quiet(Mapper, MAP_PATH)
+		names = mapper.key_names()
+		keys = random.Random(3).sample(sorted(names), min(0x1000, len(names)))
+
+		def load_map():
+			quiet(Mapper, MAP_PATH)
+
+		def get_keys():
+			for key in keys:
+				mapper.get_key(key)
+
+		cases["mapper.init"] = (load_map, os.path.getsize(MAP_PATH))
+		cases["mapper.index"] = (mapper.build_index, len(mapper.keys))
+		cases["mapper.get_key"] = (get_keys, 0)
+		cases["mapper.get_keys"] = (lambda: mapper.get_keys(keys), 0)
+
+		# compiled once here, in the work directory main keeps until every case ran
+		compiled_path = os.path.join(work_dir, "beyond.cmap")
+		mapcompiler.compile_map(MAP_PATH, compiled_path)
+		compiled = quiet(CompiledMapper, compiled_path)
+
+		def load_compiled():
+			quiet(CompiledMapper, compiled_path).reset()
+
+		cases["mapper.compiled_init"] = (load_compiled, os.path.getsize(compiled_path))
+		cases["mapper.compiled_get_keys"] = (lambda: compiled.get_keys(keys), 0)
+
+	return cases
+
+def stage(func, nbytes=0, trace=True):
+	# one timed run, then one traced run for peak allocations since tracing slows everything down
+	start = time.perf_counter()
+	result = quiet(func)
+	elapsed = time.perf_counter() - start
+
+	peak = None
+	if trace:
+		tracemalloc.start()
+		quiet(func)
+		peak = tracemalloc.get_traced_memory()[1] / 1024
+		tracemalloc.stop()
+
+	return result, {
+		"ops": 1 / elapsed,
+		"mbps": nbytes / elapsed / 0x100000 if nbytes else None,
+		"peak_kb": peak,
+		"seconds": elapsed
+	}
+
+def install_benchmarks(counts, workers=1):
+	# end to end load and extract of a generated install, per stage
+	results = {}
+
+	for count in counts:
+		folder = tempfile.mkdtemp()
+		try:
+			install = os.path.join(folder, "install")
+			output = os.path.join(folder, "output")
+
+			(files, map_path, total), results[f"install.{count}.generate"] = stage(lambda: generate_install(install, count), trace=False)
+			# one extractor for every run, its shared map is published once and removed by reset
+			extractor = extract.WwiseExtract()
+			extractor.cache_path = None
+			extractor.maps["synth"] = quiet(Mapper, map_path)
+
+			def load():
+				return extractor.load_folder("synth.map", files, "", install, lambda e: None, workers)
+
+			structure, results[f"install.{count}.load"] = stage(load, total)
+
+			def expand():
+				# same as extracting everything from the gui, every bank is opened first
+				items = []
+				stack = [([], structure)]
+				while stack:
+					parts, node = stack.pop()
+					if "bank" in node:
+						extractor.expand_bank(node)
+					for name, meta in node["files"]:
+						items.append({"name": name, "path": parts, **meta})
+					stack.extend([([*parts, name], child) for name, child in node["folders"].items()])
+				return items
+
+			items, results[f"install.{count}.expand"] = stage(expand, trace=False)
+
+			def extract_all():
+				shutil.rmtree(output, ignore_errors=True)
+				extractor.extract_files(install, [dict(e) for e in items], output, "wem", lambda e: None)
+
+			_, results[f"install.{count}.extract"] = stage(extract_all, total)
+			extractor.reset()
+		finally:
+			shutil.rmtree(folder, ignore_errors=True)
+
+	return results
+
+def compare(results, baseline, threshold):
+	# flags every benchmark whose ops/sec dropped more than threshold percent
+	regressions = []
+	for name, result in results.items():
+		if name not in baseline.get("results", {}):
+			continue
+		base = baseline["results"][name]["ops"]
+		change = (result["ops"] - base) * 100 / base
+		result["change"] = change
+		if change < -threshold:
+			regressions.append(name)
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description="AnimeWwise micro benchmarks")
+	parser.add_argument("--json", help="write results to this file")
+	parser.add_argument("--baseline", help="compare against a previous --json output")
+	parser.add_argument("--threshold", type=float, default=10, help="regression threshold in percent (default 10)")
+	parser.add_argument("--filter", default="", help="only run benchmarks containing this string")
+	parser.add_argument("--min-time", type=float, default=0.5, help="minimum time per benchmark in seconds")
+	parser.add_argument("--install", nargs="?", const="1000,10000,100000", help="also run end to end benchmarks on generated installs of these sizes (default 1000,10000,100000)")
+	parser.add_argument("--workers", type=int, default=1, help="processes used to load installs")
+	args = parser.parse_args()
+
+	results = {}
+	with tempfile.TemporaryDirectory() as work_dir:
+		for name, (func, nbytes) in benchmarks(work_dir).items():
+			if args.filter not in name:
+				continue
+			results[name] = measure(func, nbytes, args.min_time)
+
+	if args.install:
+		for name, result in install_benchmarks([int(e) for e in args.install.split(",")], args.workers).items():
+			if args.filter in name:
+				results[name] = result
+
+	regressions = []
+	if args.baseline:
+		with open(args.baseline, "r") as f:
+			baseline = json.loads(f.read())
+			f.close()
+		regressions = compare(results, baseline, args.threshold)
+
+	# report
+	print(f"{'benchmark':<32} {'ops/s':>12} {'MB/s':>10} {'peak KiB':>10} {'change':>8}")
+	for name, result in results.items():
+		mbps = f"{result['mbps']:.1f}" if result["mbps"] is not None else "-"
+		peak = f"{result['peak_kb']:.1f}" if result["peak_kb"] is not None else "-"
+		change = f"{result['change']:+.1f}%" if "change" in result else "-"
+		flag = " REGRESSION" if name in regressions else ""
+		print(f"{name:<32} {result['ops']:>12.1f} {mbps:>10} {peak:>10} {change:>8}{flag}")
+
+	if args.json:
+		output = {
+			"version": BENCH_VERSION,
+			"python": platform.python_version(),
+			"machine": platform.machine(),
+			"results": {name: {k: v for k, v in result.items() if k != "change"} for name, result in results.items()}
+		}
+		with open(args.json, "w") as f:
+			f.write(json.dumps(output, indent=4, sort_keys=True))
+			f.close()
+
+	if regressions:
+		print(f"\n{len(regressions)} regression(s) above {args.threshold}%")
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -1,50 +1,52 @@
 # bnk reader because they exist in the game
-import io
-from filereader import FileReader
+import struct
+from filereader import BufferReader
 
-def bnk2wem(data, name):
-	# gets raw data from object
-	reader = FileReader(io.BytesIO(data), "little", name=name)
+chunk_header = struct.Struct("<4sI")
 
-	bkhd_signature = reader.ReadBytes(4)
+def bnk2wem(data, name, base=0):
+	# data is the bank itself (bytes, memoryview or mmap slice), base is its offset in the parent package
+	# returned offsets are absolute in the parent package
+	length = len(data)
+
+	if length < chunk_header.size:
+		print(f"[WARNING] invalid bkhd signature at {name}")
+		return []
+
+	bkhd_signature, bkhd_size = chunk_header.unpack_from(data, 0)
 
 	if bkhd_signature != b"\x42\x4B\x48\x44":
-		print(f"[WARNING] invalid bkhd signature at {reader.GetName()}")
+		print(f"[WARNING] invalid bkhd signature at {name}")
 		return []
 
-	bkhd_size = reader.ReadUInt32()
-	reader.ReadBytes(bkhd_size)
+	pos = 8 + bkhd_size
 
-	if reader.GetBufferPos() == reader.GetStreamLength():
-		print(f"[WARNING] empty bnk file at {reader.GetName()}")
-		return [] # empty bnk
+	if pos + chunk_header.size > length:
+		print(f"[WARNING] empty bnk file at {name}")
+		return [] # empty bnk, or a trailer too short for a chunk header
 
-	didx_signature = reader.ReadBytes(4)
+	didx_signature, didx_size = chunk_header.unpack_from(data, pos)
 
 	if didx_signature != b"\x44\x49\x44\x58":
-		print(f"[WARNING] invalid didx signature at {reader.GetName()}")
+		print(f"[WARNING] invalid didx signature at {name}")
 		return [] # invalid index signature (hirc block instead ?)
 
-	didx_size = reader.ReadUInt32()
+	pos += 8
 	n_wems = didx_size // 12
-	wems = []
+	didx_end = pos + n_wems * 12
 
-	for i in range(n_wems):
-		wem_id = reader.ReadUInt32()
-		wem_offset = reader.ReadUInt32()
-		wem_size = reader.ReadUInt32()
-		wems.append([wem_id, wem_offset, wem_size])
+	if didx_end + chunk_header.size > length:
+		print(f"[WARNING] invalid data signature at {name}")
+		return [] # truncated index
 
-	data_signature = reader.ReadBytes(4)
+	data_signature, data_size = chunk_header.unpack_from(data, didx_end)
 
 	if data_signature != b"\x44\x41\x54\x41":
-		print(f"[WARNING] invalid data signature at {reader.GetName()}")
+		print(f"[WARNING] invalid data signature at {name}")
 		return [] # invalid data signature (missing sector ?)
 
-	data_size = reader.ReadUInt32()
-	data_offset = reader.GetBufferPos()
-
-	for wem in wems:
-		wem[1] += data_offset
+	data_offset = base + didx_end + 8
 
-	return wems
+	# whole index (id, offset, size) decoded in one pass, straight from the parent buffer
+	didx = BufferReader(data, "little").ReadArray("III", n_wems, pos=pos)
+	return [[wem_id, data_offset + wem_offset, wem_size] for wem_id, wem_offset, wem_size in didx]
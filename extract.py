@@ -1,19 +1,104 @@
 import os
 import io
 import json
+import atexit
+import mmap
 import wwise
+import ww2ogg
+import ptadpcm
 import tempfile
+import mapfilter
+import mapcompiler
 import wavescan
 import platform
+import sqlite3
+import threading
+import contextlib
 import subprocess
-from vfs import decrypt
-from mapper import Mapper
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from vfs import decrypt, decrypt_shared, decrypt_pool, wem_seed, PARALLEL_MIN_SIZE
+from mapper import Mapper, open_map, publish_map, attach_map
+from scancache import ScanCache
 from allocator import Allocator
 from filereader import FileReader
+from wav import write_wav, pcm_blocks
 
 cwd = os.getcwd()
+
+# map name given to load_folder to pick the map from the packages
+AUTO_MAP = "auto"
 path = lambda *args: os.path.join(*args)
 
+# wems are copied out of packages this many bytes at a time
+STREAM_WINDOW = 0x100000
+
+def scan_package(_input, lazy_banks=False, lazy_metadata=False):
+	# scan a package and parse its wems headers, this also runs in worker processes
+	# with lazy_metadata headers are left for fill_metadata and metadata is None
+	if os.path.getsize(_input) == 0:
+		print(f"[WARNING] empty file {_input}, skipping")
+		return None
+
+	filename = os.path.basename(_input)
+
+	# packages are mapped, only the parts actually read get paged in
+	with open(_input, "rb") as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		f.close()
+
+	try:
+		files = wavescan.get_data(data, filename, lazy_banks)
+		metadata = None if lazy_metadata else parse_metadata(data, files)
+	finally:
+		data.close()
+
+	return files, metadata
+
+# maps attached by this worker process, by shared memory name
+worker_maps = {}
+
+def worker_map(handle):
+	# a worker attaches once to each map published by the parent, nothing is copied
+	if handle["name"] not in worker_maps:
+		mapper = attach_map(handle)
+		# views on the segment have to be released before the worker exits
+		atexit.register(mapper.reset)
+		worker_maps[handle["name"]] = mapper
+	return worker_maps[handle["name"]]
+
+def scan_worker(_input, lazy_banks, lazy_metadata, shared_map=None):
+	# scan_package in a worker process, what it prints is given back so the caller can show it
+	# with a shared map the names are resolved here as well, keys are None otherwise
+	output = io.StringIO()
+	keys = None
+	with contextlib.redirect_stdout(output):
+		result = scan_package(_input, lazy_banks, lazy_metadata)
+		if result is not None and shared_map is not None:
+			keys = worker_map(shared_map).get_keys([file[0].split(".")[0] for file in result[0]])
+	return result, keys, output.getvalue()
+
+def scan_bank(_input, bank, lazy_metadata=False):
+	# expand one bank left collapsed by a lazy scan, and parse its wems headers
+	filename = os.path.basename(_input)
+
+	with open(_input, "rb") as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		f.close()
+
+	try:
+		files = wavescan.WaveScanner().scan_bank(data, filename, bank["id"], bank["offset"], bank["size"])
+		metadata = None if lazy_metadata else parse_metadata(data, files)
+	finally:
+		data.close()
+
+	return files, metadata
+
+def parse_metadata(data, files):
+	# headers are parsed in place in the package, wems are never copied out
+	return [wwise.parse_wwise(data, f"{file[3]}:{file[0]}:{file[1]}", file[0], file[1], file[2]) for file in files]
+
 def call(args):
 	try:
 		subprocess.call(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
@@ -25,29 +110,78 @@ class WwiseExtract:
 		self.allocator = Allocator()
 		self.hdiff_dir = None
 		self.maps = {}
+		# number of processes used to load packages and decrypt big wems, 1 keeps everything in this process
+		self.workers = os.cpu_count() or 1
+		self.decrypt_workers = None
+		# scanned packages are kept here between launches, None disables it
+		self.cache_path = path(cwd, "maps/scan.cache")
+		self.cache = None
+		# banks are only expanded when opened or extracted, results are kept per bank
+		self.lazy_banks = True
+		self.banks = {}
+		self.base_path = None
+		# wem headers are only parsed when shown, parsed metadata is kept per wem
+		self.lazy_metadata = True
+		self.metadata = {}
+		self.metadata_lock = threading.Lock()
+		# codecs decoded in this process instead of vgmstream, set to False to always use vgmstream
+		self.native_decode = True
+		# vorbis wems are rebuilt to ogg without reencoding when ww2ogg codebooks are present
+		self.codebooks_path = path(cwd, "tools/ww2ogg/packed_codebooks_aoTuV_603.bin")
+		self.rebuilder = None
+		# maps are compiled next to their source for constant time lookups, set to False to read them directly
+		self.compile_maps = True
+		# maps published for load workers, name -> (shared memory, handle for mapper.attach_map)
+		self.shared_maps = {}
 
 	### loading files ###
 
-	def load_map(self, _map):
+	def load_map(self, _map, share=False):
+		# with share, the map is also published to shared memory, see shared_map
 		map_name = _map.split(".")[0]
 
 		if map_name not in self.maps or self.maps[map_name] is None:
 			print("Map load required !")
-			mapper = Mapper(path(cwd, f"maps/{_map}"))
+			mapper = None
+			if self.compile_maps:
+				mapper = self.load_compiled_map(path(cwd, f"maps/{_map}"), path(cwd, f"maps/{map_name}.cmap"))
+			if mapper is None:
+				mapper = Mapper(path(cwd, f"maps/{_map}"))
 			self.maps[map_name] = mapper
 		else:
 			print("Mapping already loaded, skipping")
 
+		if share and map_name not in self.shared_maps:
+			self.shared_maps[map_name] = publish_map(self.maps[map_name])
+
 		return self.maps[map_name]
 
-	def load_folder(self, _map, files, diff_path, base_path, progress):
+	def shared_map(self, _map):
+		# handle workers give to mapper.attach_map, None if the map wasn't loaded with share
+		if _map is None:
+			return None
+		map_name = _map.split(".")[0]
+		if map_name not in self.shared_maps:
+			return None
+		return self.shared_maps[map_name][1]
+
+	def load_compiled_map(self, source, compiled):
+		# compiled maps are made once per map version, None means the v31 map has to be used
+		try:
+			if not mapcompiler.is_compiled(source, compiled):
+				print("> Compiling mapping, this is only done once per map version...")
+				mapcompiler.compile_map(source, compiled)
+			return open_map(compiled)
+		except Exception as e:
+			print(f"[WARNING] could not use compiled mapping, {e}")
+			return None
+
+	def load_folder(self, _map, files, diff_path, base_path, progress, workers=None):
 		self.progress = progress
 		self.steps = 1
+		self.base_path = base_path
 
 		self.mapper = None
-		if _map is not None:
-			self.mapper = self.load_map(_map)
-		
 		self.file_structure = {"folders": {}, "files": []}
 
 		hdiff_files = []
@@ -65,25 +199,170 @@ class WwiseExtract:
 		if len(files) == 0:
 			return None
 
-		pos = 0
+		if workers is None:
+			workers = self.workers
+
 		print(f"\nLoading {len(files)} files...")
+		hdiffs = []
 		for file in files:
-			pos += 1
-			self.update_progress(pos, len(files), 1)
-
 			hdiff = None
 			if f"{os.path.basename(file)}.hdiff" in hdiff_files:
 				hdiff = path(diff_path, hdiff_files[hdiff_files.index(f"{os.path.basename(file)}.hdiff")])
-			self.load_file(file, hdiff, base_path)
+			hdiffs.append(hdiff)
+
+		# unchanged packages come straight from the scan cache
+		self.cache = None
+		cached = [None] * len(files)
+		if self.cache_path is not None:
+			try:
+				self.cache = ScanCache(self.cache_path)
+				self.cache.open()
+				cached = [self.cache.get(file, os.path.relpath(file, start=base_path), self.lazy_banks, not self.lazy_metadata) if hdiff is None and os.path.getsize(file) > 0 else None for file, hdiff in zip(files, hdiffs)]
+				print(f"{len([e for e in cached if e is not None])} files found in cache")
+			except (sqlite3.Error, OSError) as e:
+				self.drop_cache(e)
+				cached = [None] * len(files)
+
+		try:
+			if _map == AUTO_MAP:
+				_map = self.detect_map(files, hdiffs, cached, base_path)
+
+			# hdiff packages need hpatchz and always go through the serial path
+			pending = [file for file, hdiff, result in zip(files, hdiffs, cached) if hdiff is None and result is None]
+			parallel = workers > 1 and len(pending) > 1
+
+			# workers map names from a shared copy of the map instead of loading their own
+			if _map is not None:
+				self.mapper = self.load_map(_map, parallel)
+
+			if parallel:
+				self.load_parallel(files, hdiffs, cached, base_path, min(workers, len(pending)), self.shared_map(_map))
+				return self.file_structure
+
+			pos = 0
+			for file, hdiff, result in zip(files, hdiffs, cached):
+				pos += 1
+				self.update_progress(pos, len(files), 1)
+				self.load_file(file, hdiff, base_path, result)
+		finally:
+			if self.cache is not None:
+				try:
+					self.cache.close()
+				except (sqlite3.Error, OSError) as e:
+					self.drop_cache(e)
+				self.cache = None
 
 		return self.file_structure
 
-	def load_file(self, _input, hdiff, base_path):
+	def detect_map(self, files, hdiffs, cached, base_path):
+		# packages are scanned until enough ids are seen, at most PROBE_PACKAGES of them
+		# probes skip the wems headers, their scans are only kept when headers are lazy anyway
+		maps_dir = path(cwd, "maps")
+		maps = [path(maps_dir, f) for f in sorted(os.listdir(maps_dir)) if f.endswith(".map") and f != "temp.map"]
+		filters = mapfilter.get_filters(maps)
+
+		ids = []
+		known = 0
+		probed = 0
+		for i, (file, hdiff) in enumerate(zip(files, hdiffs)):
+			if len(filters) == 0 or known >= mapfilter.PROBE_KEYS:
+				break
+
+			if hdiff is not None or os.path.getsize(file) == 0:
+				continue
+
+			result = cached[i]
+			if result is None:
+				if probed == mapfilter.PROBE_PACKAGES:
+					break
+				probed += 1
+
+				result = scan_package(file, self.lazy_banks, True)
+				if result is None:
+					continue
+				if self.lazy_metadata:
+					cached[i] = result
+					self.cache_put(file, os.path.relpath(file, start=base_path), result)
+
+			package_ids = [e[0].split(".")[0] for e in result[0]]
+			known += mapfilter.probe_count(filters, package_ids)
+			ids += package_ids
+
+		found, score = mapfilter.detect_map(filters, ids)
+		if found is None:
+			print(f"> No mapping matched the packages, loading without names")
+			return None
+
+		print(f"> Detected mapping {os.path.basename(found)} ({score * 100:.0f}% of ids known)")
+		return os.path.basename(found)
+
+	def load_parallel(self, files, hdiffs, cached, base_path, workers, shared_map=None):
+		# scanning, header parsing and key lookups run in workers, the structure is filled here in the original order
+		# workers are spawned, forking from the gui thread isn't safe
+		with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+			futures = [pool.submit(scan_worker, file, self.lazy_banks, self.lazy_metadata, shared_map) if hdiff is None and result is None else None for file, hdiff, result in zip(files, hdiffs, cached)]
+
+			pos = 0
+			for file, hdiff, result, future in zip(files, hdiffs, cached, futures):
+				if future is None:
+					self.load_file(file, hdiff, base_path, result)
+				else:
+					result, keys, output = future.result()
+					print(output, end="")
+					self.load_scan(file, base_path, result, keys=keys)
+
+				pos += 1
+				self.update_progress(pos, len(files), 1)
+
+	def cache_put(self, _input, relpath, result):
+		if self.cache is None:
+			return
+		try:
+			self.cache.put(_input, relpath, result, self.lazy_banks)
+		except (sqlite3.Error, OSError) as e:
+			self.drop_cache(e)
+
+	def drop_cache(self, e):
+		# a locked, corrupt or read only cache is skipped, packages are then scanned as usual
+		print(f"[WARNING] scan cache unavailable, {e}, loading without it")
+		if self.cache is not None:
+			try:
+				self.cache.close()
+			except (sqlite3.Error, OSError):
+				pass
+		self.cache = None
+
+	def load_scan(self, _input, base_path, result, cached=False, keys=None):
+		if result is None:
+			return
+
+		relpath = os.path.relpath(_input, start=base_path)
+		if not cached:
+			self.cache_put(_input, relpath, result)
+
+		self.map_names(result[0], os.path.basename(_input), relpath, metadata=result[1], keys=keys)
+
+	def load_file(self, _input, hdiff, base_path, cached=None):
+		if hdiff is None:
+			if cached is not None:
+				self.load_scan(_input, base_path, cached, True)
+			else:
+				self.load_scan(_input, base_path, scan_package(_input, self.lazy_banks, self.lazy_metadata))
+			return
+
+		if os.path.getsize(_input) == 0:
+			print(f"[WARNING] empty file {_input}, skipping")
+			return
+
+		# packages are mapped, only the parts actually read get paged in
 		with open(_input, "rb") as f:
-			data = f.read()
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 			f.close()
 
-		self.get_wems(data, os.path.basename(_input), hdiff, os.path.relpath(_input, start=base_path))
+		try:
+			self.get_wems(data, os.path.basename(_input), hdiff, os.path.relpath(_input, start=base_path))
+		finally:
+			data.close()
 
 	def get_wems(self, data, filename, hdiff, relpath):
 		files = wavescan.get_data(data, filename)
@@ -149,10 +428,13 @@ class WwiseExtract:
 
 		return files, data
 	
-	def map_names(self, files, filename, relpath, hdiff=False, data=None, skip_source=True):
+	def map_names(self, files, filename, relpath, hdiff=False, data=None, skip_source=True, metadata=None, structure=None, progress=None, keys=None):
 		# disable skip source if required
+		# structure is the node names are added to and progress the callback, the loaded folder and its progress by default
+		# keys are the names already resolved by a load worker, looked up here otherwise
 		mapper = self.mapper
-		base = self.file_structure
+		base = self.file_structure if structure is None else structure
+		progress = self.progress if progress is None else progress
 
 		if hdiff:
 			old_files = files
@@ -166,18 +448,18 @@ class WwiseExtract:
 		# banks = json.loads(handle.read())
 		# handle.close()
 
-		def process_file(file):
-			if mapper is not None:
-				key = mapper.get_key(file[0].split(".")[0])
+		# names are resolved for the whole package at once
+		if keys is None and mapper is not None:
+			keys = mapper.get_keys([file[0].split(".")[0] for file in files])
 
-				# and override the method with a manual dict lookup
-				
-				# _id = file[0].split(".")[0]
-				# if _id in list(banks["banks"].keys()):
-				# 	key = [banks["banks"][_id], ""]
-			else:
-				key = None
+			# and override the method with a manual dict lookup
+
+			# for i, file in enumerate(files):
+			# 	_id = file[0].split(".")[0]
+			# 	if _id in list(banks["banks"].keys()):
+			# 		keys[i] = [banks["banks"][_id], ""]
 
+		def process_file(file, meta, key):
 			file_data = {
 				"source": relpath,
 				"size": file[2],
@@ -186,13 +468,19 @@ class WwiseExtract:
 				"metadata": {}
 			}
 
-			wem_data = data[file_data["offset"]:file_data["offset"]+file_data["size"]]
-			parsed_wem = wwise.parse_wwise(wem_data, f"{file[3]}:{file[0]}:{file[1]}", file[0])
+			if metadata is None and data is None:
+				# lazy metadata, headers are parsed later by fill_metadata
+				file_data["metadata"] = None
+			else:
+				if metadata is not None:
+					parsed_wem = meta
+				else:
+					parsed_wem = wwise.parse_wwise(data, f"{file[3]}:{file[0]}:{file[1]}", file[0], file_data["offset"], file_data["size"])
 
-			if not parsed_wem:
-				return
+				if not parsed_wem:
+					return
 
-			file_data["metadata"] = parsed_wem
+				file_data["metadata"] = parsed_wem
 
 			if key is not None:
 				if hdiff:
@@ -205,7 +493,7 @@ class WwiseExtract:
 				if skip_source:
 					parts = parts[1:]
 
-				self.add_to_structure(parts, file_data)
+				self.add_to_structure(parts, file_data, base)
 			else:
 				temp = base["folders"]
 
@@ -230,15 +518,91 @@ class WwiseExtract:
 				temp["unmapped"]["files"].append([file[0], file_data])
 		
 		pos = 0
-		for file in files:
-			process_file(file)
+		for i, file in enumerate(files):
+			process_file(file, metadata[i] if metadata is not None else None, keys[i] if keys is not None else None)
 			pos += 1
-			self.update_progress(pos, len(files), 1)
+			# only the file bar here, the total bar follows packages and stays monotonic
+			progress(["file", pos * 100 / len(files)])
 
-		self.file_structure = base
+		# collapsed banks from lazy scans, filled by expand_bank
+		if isinstance(files, wavescan.WemIndex):
+			for bank in files.banks():
+				temp = base["folders"]
 
-	def add_to_structure(self, parts, meta):
-		current_level = self.file_structure
+				if not skip_source:
+					if filename not in temp:
+						temp[filename] = {"folders": {}, "files": []}
+					temp = temp[filename]["folders"]
+
+				if "banks" not in temp:
+					temp["banks"] = {"folders": {}, "files": []}
+				bank_name = f"{bank[0]}.bnk"
+				if bank_name in temp["banks"]["folders"]:
+					bank_name = f"{bank[0]}.bnk ({filename})"
+
+				temp["banks"]["folders"][bank_name] = {"folders": {}, "files": [], "bank": {
+					"id": bank[0],
+					"offset": bank[1],
+					"size": bank[2],
+					"source": relpath,
+					"loaded": False
+				}}
+
+	def expand_bank(self, node):
+		# fill a collapsed bank node in place with its mapped wems
+		bank = node["bank"]
+		if bank["loaded"]:
+			return node
+
+		key = (bank["source"], bank["offset"])
+		if key not in self.banks:
+			self.banks[key] = scan_bank(path(self.base_path, bank["source"]), bank, self.lazy_metadata)
+		files, metadata = self.banks[key]
+
+		# names go straight to the bank node, the loaded folder and its progress are left alone
+		self.map_names(files, os.path.basename(bank["source"]), bank["source"], metadata=metadata, structure=node, progress=lambda e: None)
+
+		bank["loaded"] = True
+		return node
+
+	def fill_metadata(self, files):
+		# parse the headers of wems loaded without metadata, unreadable ones get False so nothing is parsed twice
+		# can be called from the gui thread and a background thread at the same time
+		with self.metadata_lock:
+			pending = {}
+			for file in files:
+				if file["metadata"] is None:
+					pending.setdefault(file["source"], []).append(file)
+
+			for source, entries in pending.items():
+				missing = [file for file in entries if (source, file["offset"]) not in self.metadata]
+
+				if len(missing) > 0:
+					try:
+						with open(path(self.base_path, source), "rb") as f:
+							data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+							f.close()
+					except (OSError, ValueError) as e:
+						print(f"[WARNING] failed to read metadata from {source}, {e}")
+						data = None
+
+					try:
+						for file in missing:
+							parsed_wem = None
+							if data is not None:
+								parsed_wem = wwise.parse_wwise(data, f"{source}:{file['original_name']}:{file['offset']}", file["original_name"], file["offset"], file["size"])
+							self.metadata[(source, file["offset"])] = parsed_wem or False
+					finally:
+						if data is not None:
+							data.close()
+
+				for file in entries:
+					file["metadata"] = self.metadata[(source, file["offset"])]
+
+		return files
+
+	def add_to_structure(self, parts, meta, structure=None):
+		current_level = self.file_structure if structure is None else structure
 		for part in parts[:-1]:
 			if "folders" not in current_level:
 				current_level["folders"] = {}
@@ -277,12 +641,22 @@ class WwiseExtract:
 		new_input = output_folder
 		files = [path("/".join(file["path"]), file["name"]) for file in files]
 
+		step = 2
+		if _format == "ogg" and self.native_decode:
+			# vorbis is copied to ogg as is, only the other codecs go through wav and ffmpeg
+			self.steps += 1
+			files = self.extract_ogg(new_input, files, output, step)
+			step += 1
+			if len(files) == 0:
+				temp_dir.cleanup()
+				return
+
 		if _format == "wav":
 			output_folder = output
 		else:
 			output_folder = path(temp_dir.name, "wav")
 
-		self.extract_wav(new_input, files, output_folder)
+		self.extract_wav(new_input, files, output_folder, step)
 
 		if _format == "wav":
 			temp_dir.cleanup()
@@ -293,7 +667,7 @@ class WwiseExtract:
 		new_input = output_folder
 		output_folder = output
 
-		self.extract_ffmpeg(new_input, files, output_folder, _format)
+		self.extract_ffmpeg(new_input, files, output_folder, _format, step + 1)
 
 		temp_dir.cleanup()
 		return
@@ -302,67 +676,118 @@ class WwiseExtract:
 		print(": Extracting audio as wem")
 		all_sources = list(set([e["source"] for e in files]))
 
+		window = bytearray(STREAM_WINDOW)
+
 		pos = 0
-		for source in all_sources:
-			# load source
-			load_path = path(_input, source)
-			if self.hdiff_dir is not None:
-				source = source.split(" (hdiff)")[0]
-				hdiff_path = path(self.hdiff_dir.name, source)
+		try:
+			for source in all_sources:
+				# load source
+				load_path = path(_input, source)
+				if self.hdiff_dir is not None:
+					source = source.split(" (hdiff)")[0]
+					hdiff_path = path(self.hdiff_dir.name, source)
 				
-				if os.path.isfile(hdiff_path):
-					load_path = hdiff_path
+					if os.path.isfile(hdiff_path):
+						load_path = hdiff_path
 			
-			self.allocator.load_file(load_path, source)
+				self.allocator.load_file(load_path, source)
 
-			# extract every file from this one
-			for file in [file for file in files if file["source"] == source]:
-				pos += 1
-				self.update_progress(pos, len(files), 1)
+				# extract every file from this one
+				for file in [file for file in files if file["source"] == source]:
+					pos += 1
+					self.update_progress(pos, len(files), 1)
 
-				file["source"] = file["source"].split(" (hdiff)")[0]
-				data = self.allocator.read_at(file["source"], file["offset"], file["size"])
+					file["source"] = file["source"].split(" (hdiff)")[0]
+					filepath = path("/".join(file["path"]), file["name"])
+					self.stream_wem(file, path(output, filepath), window)
+
+				# unload source
+				self.allocator.unload_file(source)
+		finally:
+			# decrypt workers only live for one extraction
+			if self.decrypt_workers is not None:
+				self.decrypt_workers.shutdown()
+				self.decrypt_workers = None
+
+		# security
+		self.allocator.free_mem()
+
+	def stream_wem(self, file, fullpath, window):
+		# copy a wem window by window so memory doesn't scale with its size, encrypted ones are decrypted on the fly
+		size = file["size"]
+		read = self.allocator.read_into(file["source"], file["offset"], memoryview(window)[:size])
+
+		if read < 4:
+			return False
+
+		seed = None
+		if window[0:4] not in [b"RIFF", b"RIFX"]:
+			# file may be vfs encrypted
+			seed = wem_seed(file["original_name"])
+			if seed is None:
+				return False
+
+			decrypt(window, 0, read, seed, 0)
+			if window[0:4] not in [b"RIFF", b"RIFX"]:
+				return False
+
+			if size >= PARALLEL_MIN_SIZE and self.workers > 1:
+				return self.decrypt_wem(file, fullpath, seed)
+
+		os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+
+		with open(fullpath, "wb") as f:
+			f.write(memoryview(window)[:read])
+			pos = read
+
+			while pos < size and read > 0:
+				read = self.allocator.read_into(file["source"], file["offset"] + pos, memoryview(window)[:size - pos])
+				if seed is not None:
+					# keystream continues from the wem position
+					decrypt(window, 0, read, seed, pos)
+				f.write(memoryview(window)[:read])
+				pos += read
+
+			f.close()
+
+		return True
+
+	def decrypt_wem(self, file, fullpath, seed):
+		# big encrypted wems are read once to shared memory, decrypted there by the workers and written out as is
+		if self.decrypt_workers is None:
+			self.decrypt_workers = decrypt_pool(self.workers)
+
+		size = file["size"]
+		shm = shared_memory.SharedMemory(create=True, size=size)
+		try:
+			with shm.buf[:size] as view:
+				read = self.allocator.read_into(file["source"], file["offset"], view)
+				decrypt_shared(shm, 0, read, seed, 0, self.decrypt_workers)
 
-				if data[0:4] not in [b"RIFF", b"RIFX"]:
-					# file may be vfs encrypted
-					data = bytearray(data)
-					wem_id = 0
-					try:
-						wem_id = int(file["original_name"][:-4])
-					except ValueError:
-						try:
-							wem_id = int(file["original_name"][:-4], 16)
-						except ValueError:
-							continue
-					decrypt(data, 0, len(data), wem_id, 0)
-					if data[0:4] not in [b"RIFF", b"RIFX"]:
-						continue
-							
-				filepath = path("/".join(file["path"]), file["name"])
-				fullpath = path(output, filepath)
 				os.makedirs(os.path.dirname(fullpath), exist_ok=True)
-				
 				with open(fullpath, "wb") as f:
-					f.write(data)
+					f.write(view[:read])
 					f.close()
+		finally:
+			shm.close()
+			shm.unlink()
 
-			# unload source
-			self.allocator.unload_file(source)
-
-		# security
-		self.allocator.free_mem()
+		return True
 
-	def extract_wav(self, _input, files, output):
+	def extract_wav(self, _input, files, output, step=2):
 		print(": Converting audio to wav")
 		pos = 0
 		for file in files:
 			pos += 1
-			self.update_progress(pos, len(files), 2)
+			self.update_progress(pos, len(files), step)
 
 			filename = f'{os.path.basename(file).split(".")[0]}.wav'
 			filepath = path(output, os.path.dirname(file), filename)
 			os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
+			if self.native_decode and self.convert_wav(path(_input, file), filepath):
+				continue
+
 			args = [
 				path(cwd, "tools/vgmstream/vgmstream-cli.exe"),
 				"-o",
@@ -375,7 +800,94 @@ class WwiseExtract:
 
 			call(args)
 
-	def extract_ffmpeg(self, _input, files, output, _format):
+	def extract_ogg(self, _input, files, output, step=2):
+		# returns the files that still need a conversion
+		if self.rebuilder is None:
+			library = ww2ogg.load_library(self.codebooks_path)
+			if library is None:
+				print(f"[WARNING] vorbis codebooks not found at {self.codebooks_path}, using vgmstream and ffmpeg")
+				return files
+			self.rebuilder = ww2ogg.VorbisRebuilder(library)
+
+		print(": Rebuilding vorbis audio as ogg")
+		remaining = []
+		pos = 0
+		for file in files:
+			pos += 1
+			self.update_progress(pos, len(files), step)
+
+			filename = f'{os.path.basename(file).split(".")[0]}.ogg'
+			filepath = path(output, os.path.dirname(file), filename)
+			os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+			if not self.convert_ogg(path(_input, file), filepath):
+				remaining.append(file)
+
+		return remaining
+
+	def convert_ogg(self, source, destination):
+		# rebuild vorbis packets as a standard ogg stream, False means the codec isn't vorbis or rebuilding failed
+		try:
+			with open(source, "rb") as f:
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+				f.close()
+		except (OSError, ValueError):
+			return False
+
+		try:
+			meta = wwise.parse_wwise(data, source, os.path.basename(source))
+			if not meta or meta["codec"] != "VORBIS" or meta["vorbis"] is None:
+				return False
+
+			with open(destination, "wb") as f:
+				self.rebuilder.rebuild(data, meta, f)
+				f.close()
+		except Exception as e:
+			print(f"[WARNING] failed to rebuild {os.path.basename(source)}, {e}, using vgmstream and ffmpeg")
+			if os.path.isfile(destination):
+				os.remove(destination)
+			return False
+		finally:
+			data.close()
+
+		return True
+
+	def convert_wav(self, source, destination):
+		# decode in process when the codec allows it, False means vgmstream is still needed
+		try:
+			with open(source, "rb") as f:
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+				f.close()
+		except (OSError, ValueError):
+			return False
+
+		try:
+			meta = wwise.parse_wwise(data, source, os.path.basename(source))
+			if not meta or meta["codec"] not in ["PTADPCM", "PCM"]:
+				return False
+
+			if meta["codec"] == "PCM" and meta["bitsPerSample"] != 16:
+				return False
+
+			start = meta["dataOffset"]
+			with memoryview(data) as view:
+				with view[start:start+meta["dataLength"]] as audio:
+					size = meta["numSamples"] * meta["channels"] * 2
+					if meta["codec"] == "PCM":
+						# already pcm, only the header is rewritten
+						blocks = pcm_blocks(audio[:size], meta["endianness"] == "big")
+					else:
+						blocks = ptadpcm.decode(audio, meta["channels"], meta["interleaveBlockSize"], meta["numSamples"])
+					write_wav(destination, meta["channels"], meta["sampleRate"], 16, size, blocks)
+		except Exception as e:
+			print(f"[WARNING] failed to decode {os.path.basename(source)}, {e}, using vgmstream")
+			return False
+		finally:
+			data.close()
+
+		return True
+
+	def extract_ffmpeg(self, _input, files, output, _format, step=3):
 		print(f": Converting audio to {_format}")
 
 		encoders = {
@@ -388,7 +900,7 @@ class WwiseExtract:
 		pos = 0
 		for file in files:
 			pos += 1
-			self.update_progress(pos, len(files), 3)
+			self.update_progress(pos, len(files), step)
 
 			filename = f'{os.path.basename(file).split(".")[0]}.{_format}'
 			filepath = path(output, os.path.dirname(file), filename)
@@ -419,9 +931,17 @@ class WwiseExtract:
 
 	def reset(self):
 		self.mapper = None
+		self.banks.clear()
+		with self.metadata_lock:
+			self.metadata.clear()
 		for e in self.maps.values():
 			e.reset()
 		self.maps.clear()
+		# workers only attach, the segments are removed here
+		for shared, handle in self.shared_maps.values():
+			shared.close()
+			shared.unlink()
+		self.shared_maps.clear()
 		self.allocator.free_mem()
 		if self.hdiff_dir is not None:
 			self.hdiff_dir.cleanup()
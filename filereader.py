@@ -91,3 +91,191 @@ class FileReader:
 		if self.name:
 			return self.name
 		return ""
+
+
+# precompiled unpackers for BufferReader, by endianness then struct mode
+UNPACKERS = {endianness: {mode: struct.Struct(f"{prefix}{mode}") for mode in "bBhHiIlLqQ"} for endianness, prefix in [("little", "<"), ("big", ">")]}
+# structs of the formats given to ReadArray and whether they hold a single value, by byte order and format
+# the count is never part of the key, so this only grows with the formats used in the code
+ARRAY_STRUCTS = {}
+
+
+class BufferReader:
+	"""
+	Reader for in-memory buffers (bytes, mmap, memoryview), same api as FileReader
+	Values are read in place with unpackers bound for the current endianness, positional reads never seek
+	"""
+
+	def __init__(self, buffer, endianness:str, name:str=None, pos:int=0):
+		self.buffer = buffer
+		self.name = name
+		self.pos = pos
+
+		# objects without the buffer protocol (like vfs overlays) are read through slices
+		try:
+			memoryview(buffer).release()
+			self.direct = True
+		except TypeError:
+			self.direct = False
+
+		self.endianness = endianness
+
+	@property
+	def endianness(self) -> str:
+		return self._endianness
+
+	@endianness.setter
+	def endianness(self, endianness:str):
+		# parsers switch endianness after the header, unpackers are rebound here and not on every read
+		self._endianness = endianness
+		unpackers = [self._unpacker(mode, endianness) for mode in "bBhHiIlLqQ"]
+		self._i8, self._u8, self._i16, self._u16, self._i32, self._u32, self._l32, self._ul32, self._i64, self._u64 = unpackers
+
+	def _unpacker(self, mode:str, endianness:str):
+		unpacker = UNPACKERS["little" if endianness == "little" else "big"][mode]
+		if self.direct:
+			return unpacker.unpack_from
+		return lambda buffer, pos: unpacker.unpack(buffer[pos:pos+unpacker.size])
+
+	def _read(self, unpack, size:int, mode:str, endianness:str, pos:int):
+		# endianness override
+		if endianness is not None:
+			unpack = self._unpacker(mode, endianness)
+
+		if pos is not None:
+			return unpack(self.buffer, pos)[0]
+
+		data = unpack(self.buffer, self.pos)[0]
+		self.pos += size
+		return data
+
+	# read methods, the common case (no override) calls the bound unpacker directly
+	def ReadInt8(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._i8(self.buffer, self.pos)[0]
+			self.pos += 1
+			return data
+		return self._read(self._i8, 1, "b", endianness, pos)
+
+	def ReadUInt8(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._u8(self.buffer, self.pos)[0]
+			self.pos += 1
+			return data
+		return self._read(self._u8, 1, "B", endianness, pos)
+
+	def ReadInt16(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._i16(self.buffer, self.pos)[0]
+			self.pos += 2
+			return data
+		return self._read(self._i16, 2, "h", endianness, pos)
+
+	def ReadUInt16(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._u16(self.buffer, self.pos)[0]
+			self.pos += 2
+			return data
+		return self._read(self._u16, 2, "H", endianness, pos)
+
+	def ReadInt32(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._i32(self.buffer, self.pos)[0]
+			self.pos += 4
+			return data
+		return self._read(self._i32, 4, "i", endianness, pos)
+
+	def ReadUInt32(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._u32(self.buffer, self.pos)[0]
+			self.pos += 4
+			return data
+		return self._read(self._u32, 4, "I", endianness, pos)
+
+	def ReadLong(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._l32(self.buffer, self.pos)[0]
+			self.pos += 4
+			return data
+		return self._read(self._l32, 4, "l", endianness, pos)
+
+	def ReadULong(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._ul32(self.buffer, self.pos)[0]
+			self.pos += 4
+			return data
+		return self._read(self._ul32, 4, "L", endianness, pos)
+
+	def ReadLongLong(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._i64(self.buffer, self.pos)[0]
+			self.pos += 8
+			return data
+		return self._read(self._i64, 8, "q", endianness, pos)
+
+	def ReadULongLong(self, endianness:str=None, pos:int=None) -> int:
+		if endianness is None and pos is None:
+			data = self._u64(self.buffer, self.pos)[0]
+			self.pos += 8
+			return data
+		return self._read(self._u64, 8, "Q", endianness, pos)
+
+	def ReadBytes(self, length:int, endianness:str=None, pos:int=None) -> bytes:
+		start = self.pos if pos is None else pos
+		data = bytes(self.buffer[start:start+int(length)])
+
+		if len(data) != length:
+			raise struct.error(f"unpack requires a buffer of {length} bytes")
+
+		if pos is None:
+			self.pos += len(data)
+		return data
+
+	def ReadArray(self, fmt:str, count:int, endianness:str=None, pos:int=None) -> list:
+		# count records of a format without byte order, single types give values and composite formats tuples
+		endianness = self.endianness if endianness is None else endianness
+		key = (endianness == "little", fmt)
+		if key not in ARRAY_STRUCTS:
+			unpacker = struct.Struct(f"{'<' if key[0] else '>'}{fmt}")
+			ARRAY_STRUCTS[key] = unpacker, len(unpacker.unpack(bytes(unpacker.size))) == 1
+		unpacker, single = ARRAY_STRUCTS[key]
+
+		start = self.pos if pos is None else pos
+		length = unpacker.size * count
+
+		if self.direct:
+			with memoryview(self.buffer) as view:
+				with view[start:start+length] as table:
+					if len(table) != length:
+						raise struct.error(f"unpack requires a buffer of {length} bytes")
+					data = list(unpacker.iter_unpack(table))
+		else:
+			table = self.buffer[start:start+length]
+			if len(table) != length:
+				raise struct.error(f"unpack requires a buffer of {length} bytes")
+			data = list(unpacker.iter_unpack(table))
+
+		if single:
+			data = [e[0] for e in data]
+
+		if pos is None:
+			self.pos += length
+		return data
+
+	# buffer utils
+	def GetBufferPos(self) -> int:
+		return self.pos
+
+	def SetBufferPos(self, pos:int):
+		self.pos = pos
+
+	def GetStreamLength(self) -> int:
+		return len(self.buffer)
+
+	def GetRemainingLength(self) -> int:
+		return self.GetStreamLength() - self.GetBufferPos()
+
+	def GetName(self) -> str:
+		if self.name:
+			return self.name
+		return ""
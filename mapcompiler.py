@@ -0,0 +1,179 @@
+# compiles a v31 .map into the compiled format read by mapper.CompiledMapper
+# usage: python mapcompiler.py input.map output.cmap
+import os
+import struct
+import argparse
+
+from mapper import Mapper, is_compiled_header, COMPILED_VERSION, COMPILED_SECTORS, SLOT, MUSIC_SLOT, SEED, DIRECT_SLOT, key_hash
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# average keys per bucket, more is a smaller seeds sector but a longer compile
+BUCKET_SIZE = 4
+# seeds tried at once when numpy is there
+SEED_BATCH = 0x100
+
+def find_seed_numpy(keys, n_keys, taken):
+	# same search as build_hash, SEED_BATCH seeds are tried at once
+	values = np.array(keys, dtype=np.uint64)[:, None]
+	free = np.frombuffer(taken, dtype=np.uint8)
+
+	for start in range(1, DIRECT_SLOT, SEED_BATCH):
+		seeds = np.arange(start, min(start + SEED_BATCH, DIRECT_SLOT), dtype=np.uint64)[None, :]
+
+		# key_hash with wrapping 64 bits arithmetic
+		with np.errstate(over="ignore"):
+			hashed = values ^ (seeds * np.uint64(0x9E3779B97F4A7C15))
+			hashed = (hashed ^ (hashed >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+			hashed = (hashed ^ (hashed >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+			hashed = hashed ^ (hashed >> np.uint64(31))
+
+		positions = np.sort(hashed % np.uint64(n_keys), axis=0).astype(np.intp)
+		valid = (free[positions] == 0).all(axis=0) & (np.diff(positions, axis=0) != 0).all(axis=0)
+
+		if valid.any():
+			return start + int(np.argmax(valid))
+
+	raise Exception("could not build the key hash")
+
+def build_hash(values):
+	# hash and displace, buckets are placed biggest first with the first seed that fits all their keys in free slots
+	n_keys = len(values)
+	n_buckets = max(1, (n_keys + BUCKET_SIZE - 1) // BUCKET_SIZE)
+
+	buckets = [[] for i in range(n_buckets)]
+	for value in values:
+		buckets[key_hash(value, 0) % n_buckets].append(value)
+
+	seeds = [0] * n_buckets
+	slots = [None] * n_keys
+	taken = bytearray(n_keys)
+	free = 0
+
+	for bucket in sorted(range(n_buckets), key=lambda e: -len(buckets[e])):
+		keys = buckets[bucket]
+		if len(keys) == 0:
+			break
+
+		if len(keys) == 1:
+			# single keys go straight to the next free slot, the seed is then the slot itself
+			while taken[free]:
+				free += 1
+			seeds[bucket] = DIRECT_SLOT | free
+			taken[free] = 1
+			slots[free] = keys[0]
+			continue
+
+		if np is not None:
+			seed = find_seed_numpy(keys, n_keys, taken)
+			positions = [key_hash(value, seed) % n_keys for value in keys]
+		else:
+			seed = 1
+			while True:
+				positions = [key_hash(value, seed) % n_keys for value in keys]
+				if len(set(positions)) == len(positions) and not any([taken[e] for e in positions]):
+					break
+				seed += 1
+				if seed >= DIRECT_SLOT:
+					raise Exception("could not build the key hash")
+
+		seeds[bucket] = seed
+		for position, value in zip(positions, keys):
+			taken[position] = 1
+			slots[position] = value
+
+	return seeds, slots
+
+def compile_map(source, destination):
+	# returns the number of keys written
+	mapper = Mapper(source, quiet=True)
+
+	try:
+		key_size = mapper.key_size
+		if key_size - 3 > 8:
+			raise Exception("keys are too long for the compiled format")
+
+		# last duplicate wins, same as the v31 lookup
+		records = {}
+		for i in range(0, len(mapper.keys), key_size):
+			records[int.from_bytes(mapper.keys[i+3:i+key_size], "big")] = int.from_bytes(mapper.keys[i:i+3], "big")
+
+		text = bytearray()
+		text_offsets = {}
+
+		def add_text(string):
+			if string not in text_offsets:
+				raw = string.encode("utf-8")
+				if len(raw) > 0xFFFF:
+					raise Exception(f"name too long for the compiled format: {string[:32]}")
+				text_offsets[string] = (len(text), len(raw))
+				text.extend(raw)
+			return text_offsets[string]
+
+		seeds, slots = build_hash(list(records))
+
+		slots_data = bytearray()
+		for value in slots:
+			name, lang = mapper.get_name(records[value])
+			slots_data += SLOT.pack(value, *add_text(name), lang)
+
+		music_data = bytearray()
+		for key, name in sorted([(int(k), v) for k, v in mapper.music_keys.items()]):
+			music_data += MUSIC_SLOT.pack(key, *add_text(name))
+
+		languages = bytes([len(mapper.languages)]) + b"".join([bytes([len(e.encode("utf-8"))]) + e.encode("utf-8") for e in mapper.languages])
+
+		# game and version are copied from the source header
+		game = mapper.game.encode("utf-8")
+		header = b"ESFM" + bytes(2) + COMPILED_VERSION + bytes(2) + bytes([len(game)]) + game + bytes([mapper.version])
+		header += struct.pack("<BIII", key_size - 3, len(slots), len(seeds), len(music_data) // MUSIC_SLOT.size)
+
+		sectors = [languages, b"".join([SEED.pack(e) for e in seeds]), bytes(slots_data), bytes(music_data), bytes(text)]
+		table_size = 16 * len(COMPILED_SECTORS)
+
+		# sectors are 8 bytes aligned
+		table = bytearray()
+		body = bytearray()
+		pos = len(header) + table_size
+		for sector in sectors:
+			padding = -(pos + len(body)) % 8
+			body += bytes(padding)
+			table += struct.pack("<QQ", pos + len(body), len(sector))
+			body += sector
+
+		# written next to the destination first, a reader never sees half a map
+		temp = f"{destination}.tmp"
+		with open(temp, "wb") as f:
+			f.write(header + table + body)
+			f.close()
+		os.replace(temp, destination)
+
+		return len(slots)
+	finally:
+		mapper.reset()
+
+def is_compiled(source, destination):
+	# compiled map exists, is newer than its source and was written by this version of the compiler
+	if not os.path.isfile(destination) or os.path.getmtime(destination) < os.path.getmtime(source):
+		return False
+
+	with open(destination, "rb") as f:
+		header = f.read(8)
+		f.close()
+
+	return is_compiled_header(header)
+
+def main():
+	parser = argparse.ArgumentParser(description="AnimeWwise map compiler")
+	parser.add_argument("input", help="v31 .map file")
+	parser.add_argument("output", help="compiled map to write")
+	args = parser.parse_args()
+
+	n_keys = compile_map(args.input, args.output)
+	print(f"wrote {n_keys} keys to {args.output}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,137 @@
+# bloom filters of every map's keys, used to find the map of a package without loading any map
+import os
+import struct
+
+from mapper import open_map, key_hash
+
+FILTER_VERSION = 1
+# bits per key and hashes per key, about 2% false positives
+BITS_PER_KEY = 8
+HASHES = 6
+# hex ids looked at per detection, and the share of them a map must know to be picked
+PROBE_KEYS = 0x400
+MIN_SCORE = 0.5
+# packages scanned at most while looking for PROBE_KEYS ids
+PROBE_PACKAGES = 8
+
+HEADER = struct.Struct("<4sBBBI")
+
+
+class BloomFilter:
+	"""
+	Bit array over key values, the positions are derived from a single mapper.key_hash
+	"""
+
+	def __init__(self, key_size, n_bits, hashes=HASHES, bits=None):
+		# key_size is in bytes, ids are hex strings twice as long
+		self.key_size = key_size
+		self.n_bits = n_bits
+		self.hashes = hashes
+		self.bits = bytearray((n_bits + 7) // 8) if bits is None else bits
+
+	def positions(self, value):
+		hashed = key_hash(value, 0xB100)
+		step = (hashed >> 32) | 1
+		hashed &= 0xFFFFFFFF
+		return [(hashed + i * step) % self.n_bits for i in range(self.hashes)]
+
+	def add(self, value):
+		for pos in self.positions(value):
+			self.bits[pos >> 3] |= 1 << (pos & 7)
+
+	def __contains__(self, value):
+		return all([self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self.positions(value)])
+
+	def to_bytes(self):
+		return HEADER.pack(b"ESBF", FILTER_VERSION, self.key_size, self.hashes, self.n_bits) + bytes(self.bits)
+
+def read_filter(filter_file):
+	with open(filter_file, "rb") as f:
+		data = f.read()
+		f.close()
+
+	magic, version, key_size, hashes, n_bits = HEADER.unpack_from(data)
+	if magic != b"ESBF" or version != FILTER_VERSION:
+		raise Exception("invalid map filter")
+
+	return BloomFilter(key_size, n_bits, hashes, bytearray(data[HEADER.size:]))
+
+def filter_path(map_path):
+	return f"{os.path.splitext(map_path)[0]}.bloom"
+
+def build_filter(map_path):
+	# filters are written next to their map
+	mapper = open_map(map_path, quiet=True)
+	try:
+		values = mapper.key_values()
+		bloom = BloomFilter(mapper.key_size - 3, max(64, len(values) * BITS_PER_KEY))
+	finally:
+		mapper.reset()
+
+	for value in values:
+		bloom.add(value)
+
+	destination = filter_path(map_path)
+	with open(f"{destination}.tmp", "wb") as f:
+		f.write(bloom.to_bytes())
+		f.close()
+	os.replace(f"{destination}.tmp", destination)
+
+	return bloom
+
+def get_filter(map_path):
+	# filter of a map, rebuilt when the map is newer, None if it can't be made
+	destination = filter_path(map_path)
+	try:
+		if os.path.isfile(destination) and os.path.getmtime(destination) >= os.path.getmtime(map_path):
+			return read_filter(destination)
+		return build_filter(map_path)
+	except Exception as e:
+		print(f"[WARNING] could not get the filter of {os.path.basename(map_path)}, {e}")
+		return None
+
+def key_value(key, key_size):
+	# same rules as Mapper lookups, only lowercase hex of the exact key size can match
+	try:
+		raw = bytes.fromhex(key)
+	except ValueError:
+		return None
+
+	if len(raw) != key_size or raw.hex() != key:
+		return None
+
+	return int.from_bytes(raw, "big")
+
+def get_filters(map_paths):
+	# filters of the maps that have one, by map path
+	filters = {}
+	for map_path in map_paths:
+		bloom = get_filter(map_path)
+		if bloom is not None:
+			filters[map_path] = bloom
+	return filters
+
+def probe_count(filters, ids):
+	# ids at least one of the filters can be asked about
+	key_sizes = set([e.key_size for e in filters.values()])
+	return len([e for e in ids if any([key_value(e, size) is not None for size in key_sizes])])
+
+def detect_map(filters, ids):
+	# map knowing the biggest share of the ids, None when none of them knows enough
+	best = None
+	best_score = 0
+
+	for map_path, bloom in filters.items():
+		values = [key_value(e, bloom.key_size) for e in ids]
+		values = [e for e in values if e is not None]
+		if len(values) == 0:
+			continue
+
+		score = len([e for e in values if e in bloom]) / len(values)
+		if score > best_score:
+			best, best_score = map_path, score
+
+	if best_score < MIN_SCORE:
+		return None, best_score
+
+	return best, best_score
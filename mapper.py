@@ -1,16 +1,127 @@
 # reader for the .map format i've made to improve reading speed and mapping size
-import io
+import sys
 import json
-from filereader import FileReader
+import mmap
+import struct
+import array
+import threading
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from bisect import bisect_right
+from filereader import BufferReader
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# decoded words kept around, names share most of their words so this stays small
+WORD_CACHE = 0x4000
+# strings are xored with 0x97 + their size, one translation table per size
+XOR_TABLES = [bytes([b ^ ((0x97 + size) & 0xFF) for b in range(256)]) for size in range(256)]
+
+GAMES = {
+	"hk4e": "Genshin",
+	"hkrpg": "Star Rail",
+	"nap": "Zenless Zone Zero",
+	"beyond": "Arknights Endfield"
+	# more later
+}
+
+# compiled maps, made by mapcompiler from a v31 map
+COMPILED_VERSION = b"40"
+COMPILED_SECTORS = ["languages", "seeds", "slots", "music", "text"]
+# key, name offset and size in the text sector, language
+SLOT = struct.Struct("<QIHBx")
+# music key, name offset and size in the text sector
+MUSIC_SLOT = struct.Struct("<IIH2x")
+SEED = struct.Struct("<I")
+# seeds with this bit set are the slot of a bucket holding a single key
+DIRECT_SLOT = 0x80000000
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+def key_hash(value, seed):
+	# splitmix64 finalizer, seed 0 picks the bucket and the bucket seed picks the slot
+	value = (value ^ (seed * 0x9E3779B97F4A7C15)) & MASK64
+	value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+	value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+	return value ^ (value >> 31)
+
+def open_view(mapping_file, shared):
+	# buffer a map is read from, either the mapped file or a shared map from publish_map
+	if shared is not None:
+		try:
+			# 3.13+, the publisher owns the segment so attaching must not track it
+			data = shared_memory.SharedMemory(name=shared["name"], track=False)
+		except TypeError:
+			data = shared_memory.SharedMemory(name=shared["name"])
+		return data, data.buf[:shared["size"]]
+
+	with open(mapping_file, "rb") as file:
+		try:
+			data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			raise Exception("mapping was invalid")
+		file.close()
+	return data, memoryview(data)
+
+def publish_map(mapper):
+	# copies a loaded map to shared memory, returns the segment and a picklable handle for attach_map
+	# the caller owns the segment and has to close and unlink it once workers are done
+	size = len(mapper.view)
+	index = None
+	extra = []
+
+	if isinstance(mapper, Mapper) and mapper.key_size - 3 <= 8:
+		# v31 indexes are shared as well so workers don't build their own
+		mapper.ensure_index()
+		start = size + (-size % 8)
+		extra = [(start, mapper.index), (start + 8 * len(mapper.index), mapper.order)]
+		index = [start, len(mapper.index)]
+
+	total = max(1, extra[-1][0] + 4 * len(extra[-1][1]) if extra else size)
+	shared = shared_memory.SharedMemory(create=True, size=total)
+	shared.buf[:size] = mapper.view
+	for start, values in extra:
+		with memoryview(values) as view:
+			shared.buf[start:start+view.nbytes] = view.cast("B")
+
+	handle = {
+		"name": shared.name,
+		"size": size,
+		"compiled": isinstance(mapper, CompiledMapper),
+		"index": index
+	}
+
+	return shared, handle
+
+def attach_map(handle):
+	# reader over a map published by another process, nothing is copied
+	if handle["compiled"]:
+		return CompiledMapper(shared=handle)
+	return Mapper(shared=handle)
+
+def is_compiled_header(header):
+	return header[0:4] == b"ESFM" and header[6:8] == COMPILED_VERSION
+
+def open_map(mapping_file, quiet=False):
+	# picks the reader from the map version, quiet skips the load summary
+	with open(mapping_file, "rb") as f:
+		header = f.read(8)
+		f.close()
+
+	if is_compiled_header(header):
+		return CompiledMapper(mapping_file, quiet=quiet)
+	return Mapper(mapping_file, quiet=quiet)
 
 
 class Mapper:
-	def __init__(self, mapping_file):
-		file = open(mapping_file, "rb")
-		self.data = file.read()
-		file.close()
+	def __init__(self, mapping_file=None, shared=None, quiet=False):
+		# the map is never copied, sectors are views over the mapped file or the shared map
+		self.data, self.view = open_view(mapping_file, shared)
+		self.quiet = quiet
 
-		reader = FileReader(io.BytesIO(self.data), "little")
+		reader = BufferReader(self.view, "little")
 
 		# check file
 		if reader.ReadBytes(4) != b"ESFM":
@@ -25,27 +136,34 @@ class Mapper:
 
 		reader.ReadBytes(2)
 
+		# keys index, built on first lookup
+		self.index = None
+		self.order = None
+		self.index_lock = threading.Lock()
+
 		self.process_map(reader)
 
+		if shared is not None and shared["index"] is not None:
+			# stored after the map itself
+			start, n_keys = shared["index"]
+			self.index = self.data.buf[start:start+8*n_keys].cast("Q")
+			self.order = self.data.buf[start+8*n_keys:start+12*n_keys].cast("I")
+
 	def process_map(self, reader):
-		games = {
-			"hk4e": "Genshin",
-			"hkrpg": "Star Rail",
-			"nap": "Zenless Zone Zero",
-			"beyond": "Arknights Endfield"
-			# more later
-		}
+		games = GAMES
 
 		# read config
 		game_size = reader.ReadInt8()
-		game = reader.ReadBytes(game_size).decode("utf-8")
+		self.game = reader.ReadBytes(game_size).decode("utf-8")
+		self.version = reader.ReadInt8()
 
 		infos = {
-			"game": games[game],
-			"version": ".".join(list(str(reader.ReadInt8())))
+			"game": games[self.game],
+			"version": ".".join(list(str(self.version)))
 		}
 
-		print(f"> Loading mapping for {infos['game']} v{infos['version']}, this may take a few seconds...")
+		if not self.quiet:
+			print(f"> Loading mapping for {infos['game']} v{infos['version']}")
 
 		# sectors
 		def int24():
@@ -71,13 +189,18 @@ class Mapper:
 			name = bytes([b ^ (0x97 + size) for b in reader.ReadBytes(size)]).decode("utf-8")
 			self.languages.append(name)
 
-		# alloc sectors
-		reader.SetBufferPos(sectors["strings"][0])
-		self.strings = bytearray(reader.ReadBytes(sectors["strings"][1]))
-		reader.SetBufferPos(sectors["words"][0])
-		self.words = bytearray(reader.ReadBytes(sectors["words"][1]))
-		reader.SetBufferPos(sectors["files"][0])
-		self.files = bytearray(reader.ReadBytes(sectors["files"][1]))
+		# sectors
+		def sector(name, skip=0):
+			start, size = sectors[name]
+			return self.view[start+skip:start+size]
+
+		self.strings = sector("strings")
+		self.words = sector("words")
+		self.files = sector("files")
+
+		# strings are decoded on first use
+		self.string_table = {}
+		self.word_cache = OrderedDict()
 
 		# read keys
 		reader.SetBufferPos(sectors["keys"][0])
@@ -85,8 +208,9 @@ class Mapper:
 		n_keys = (sectors["keys"][1]-1) // key_size
 		n_files = n_keys // n_langs
 
-		keys_data = bytearray(reader.ReadBytes(sectors["keys"][1]-1))
-		self.keys = {keys_data[i+3:i+key_size].hex(): int.from_bytes(keys_data[i:i+3], "big") for i in range(0, len(keys_data), key_size)}
+		# records are kept raw (3 bytes file + key), they are only indexed when a key is looked up
+		self.key_size = key_size
+		self.keys = sector("keys", 1)[:n_keys * key_size]
 
 		# music
 		self.music_keys = {}
@@ -105,6 +229,9 @@ class Mapper:
 				self.music_keys[str(key)] = f"{root}\\{name}"
 
 		# done
+		if self.quiet:
+			return
+
 		print(f"> Finished loading mapping")
 		print(f"=-=-= Voicelines sector =-=-=")
 		print(f": {n_langs} languages")
@@ -113,46 +240,370 @@ class Mapper:
 		if hasMusic:
 			print(f": {n_music} musics")
 
-	def get_key(self, key, lang=False):
-		if (not key in self.keys) and (not key in self.music_keys):
+	def build_index(self):
+		# sorted key values and the record each one comes from, stable so the last duplicate wins like a dict
+		key_size = self.key_size
+		n_keys = len(self.keys) // key_size
+
+		if np is not None and key_size - 3 <= 8:
+			records = np.frombuffer(self.keys, dtype=np.uint8).reshape(n_keys, key_size)
+			values = np.zeros(n_keys, dtype=np.uint64)
+			for i in range(3, key_size):
+				values = (values << np.uint64(8)) | records[:, i]
+			order = np.argsort(values, kind="stable")
+
+			index = array.array("Q", values[order].tobytes())
+			order = array.array("I", order.astype(np.uint32).tobytes())
+		else:
+			values = [int.from_bytes(self.keys[i+3:i+key_size], "big") for i in range(0, len(self.keys), key_size)]
+			order = sorted(range(n_keys), key=values.__getitem__)
+
+			index = [values[i] for i in order]
+			if key_size - 3 <= 8:
+				index = array.array("Q", index)
+			order = array.array("I", order)
+
+		self.order = order
+		self.index = index
+
+	def key_value(self, key):
+		# hex key to the value stored in the index, None if it can't be a mapped key
+		try:
+			raw = bytes.fromhex(key)
+		except ValueError:
 			return None
 
+		if len(raw) != self.key_size - 3 or raw.hex() != key:
+			return None
+
+		self.ensure_index()
+		return int.from_bytes(raw, "big")
+
+	def ensure_index(self):
+		if self.index is None:
+			with self.index_lock:
+				if self.index is None:
+					self.build_index()
+
+	def find_record(self, value):
+		pos = bisect_right(self.index, value) - 1
+		if pos < 0 or self.index[pos] != value:
+			return None
+
+		pos = self.order[pos] * self.key_size
+		return int.from_bytes(self.keys[pos:pos+3], "big")
+
+	def find_records(self, values):
+		# same as find_record for many values, searched all at once when numpy is there
+		if np is None or isinstance(self.index, list) or len(values) == 0:
+			return [self.find_record(value) for value in values]
+
+		index = np.frombuffer(self.index, dtype=np.uint64)
+		values = np.array(values, dtype=np.uint64)
+		found = np.searchsorted(index, values, side="right") - 1
+		valid = (found >= 0) & (index[np.maximum(found, 0)] == values)
+
+		records = []
+		for pos, ok in zip(found.tolist(), valid.tolist()):
+			if not ok:
+				records.append(None)
+				continue
+			pos = self.order[pos] * self.key_size
+			records.append(int.from_bytes(self.keys[pos:pos+3], "big"))
+
+		return records
+
+	def find_key(self, key):
+		# file record of an hex key, None if it is not mapped
+		value = self.key_value(key)
+		if value is None:
+			return None
+
+		return self.find_record(value)
+
+	def key_names(self):
+		# every mapped key as it is looked up, in map order
+		return [self.keys[i+3:i+self.key_size].hex() for i in range(0, len(self.keys), self.key_size)]
+
+	def key_values(self):
+		# key_names as integers
+		return [int.from_bytes(self.keys[i+3:i+self.key_size], "big") for i in range(0, len(self.keys), self.key_size)]
+
+	def decode_string(self, offset):
+		size = self.strings[offset]
+		if size > 128:
+			# numbers are stored as integers, size is offset by 128
+			return str(int.from_bytes(self.strings[offset+1:offset+1+(size-128)], "big"))
+
+		string = bytes(self.strings[offset+1:offset+1+size]).translate(XOR_TABLES[size]).decode("utf-8")
+		return sys.intern(string)
+
+	def get_string(self, offset):
+		if offset not in self.string_table:
+			self.string_table[offset] = self.decode_string(offset)
+		return self.string_table[offset]
+
+	def get_word(self, offset):
+		word = self.word_cache.get(offset)
+		if word is not None:
+			self.word_cache.move_to_end(offset)
+			return word
+
+		string_offsets = struct.unpack_from(f">{self.words[offset]}H", self.words, offset + 1)
+		table = self.string_table
+		word = "_".join([table[e] if e in table else self.get_string(e) for e in string_offsets])
+
+		self.word_cache[offset] = word
+		if len(self.word_cache) > WORD_CACHE:
+			self.word_cache.popitem(last=False)
+
+		return word
+
+	def get_name(self, record):
+		# full name of a file record and its language index
+		lang, offset = (record >> 22) & 0x03, record & 0x3FFFFF
+
+		parts = self.files[offset]
+		name = [self.get_word(int.from_bytes(self.files[offset+1+(3*i):offset+4+(3*i)], "big")) for i in range(parts)]
+
+		return "\\".join(name), lang
+
+	def get_key(self, key, lang=False):
+		# the language is appended whenever the record has one, lang is only kept for older callers
 		if key in self.music_keys:
 			return [self.music_keys[key], ""]
 
-		lang, offset = (self.keys[key] >> 22) & 0x03, self.keys[key] & 0x3FFFFF
+		record = self.find_key(key)
+		if record is None:
+			return None
 
-		parts = int.from_bytes(self.files[offset:offset+1], "big")
-		name = []
+		name, lang_id = self.get_name(record)
+		name = [name]
 
-		for i in range(parts):
-			word_offset = int.from_bytes(self.files[offset+1+(3*i):offset+4+(3*i)], "big")
-			word_parts = int.from_bytes(self.words[word_offset:word_offset+1], "big")
-			word = []
+		if lang_id:
+			name.append(self.languages[lang_id])
 
-			for j in range(word_parts):
-				string_offset = int.from_bytes(self.words[word_offset+1+(2*j):word_offset+3+(2*j)], "big")
-				string_size = int.from_bytes(self.strings[string_offset:string_offset+1], "big")
-				if string_size > 128:
-					string = str(int.from_bytes(self.strings[string_offset+1:string_offset+1+(string_size-128)], "big"))
-				else:
-					string = bytes([b ^ (0x97 + string_size) for b in self.strings[string_offset+1:string_offset+1+string_size]]).decode("utf-8")
-				word.append(string)
+		return name
 
-			word = "_".join(word)
-			name.append(word)
+	def get_keys(self, keys, lang=False):
+		# get_key for a whole list of keys, each record is only decoded once
+		results = [None] * len(keys)
+		pending = []
 
-		name = ["\\".join(name)]
-		
-		if lang:
-			name.append(self.languages[lang])
+		for i, key in enumerate(keys):
+			if key in self.music_keys:
+				results[i] = [self.music_keys[key], ""]
+				continue
 
-		return name
+			value = self.key_value(key)
+			if value is not None:
+				pending.append((i, value))
+
+		names = {}
+		for (i, value), record in zip(pending, self.find_records([e[1] for e in pending])):
+			if record is None:
+				continue
+
+			if record not in names:
+				names[record] = self.get_name(record)
+			name, lang_id = names[record]
+
+			results[i] = [name, self.languages[lang_id]] if lang_id else [name]
+
+		return results
 
 	def reset(self):
 		self.reader = None
+		self.string_table.clear()
+		self.word_cache.clear()
 		self.languages.clear()
-		self.strings.clear()
-		self.words.clear()
-		self.files.clear()
 		self.music_keys.clear()
+
+		# views have to be released before the map can be closed, shared indexes are views too
+		for view in [self.strings, self.words, self.files, self.keys, self.index, self.order, self.view]:
+			if isinstance(view, memoryview):
+				view.release()
+		self.index = None
+		self.order = None
+		self.strings = self.words = self.files = self.keys = self.view = memoryview(b"")
+		self.data.close()
+
+
+class CompiledMapper:
+	"""
+	Reader for compiled maps, same api as Mapper
+	Keys go through a minimal perfect hash and names are stored decoded, nothing is built at load time
+	"""
+
+	def __init__(self, mapping_file=None, shared=None, quiet=False):
+		self.data, self.view = open_view(mapping_file, shared)
+
+		reader = BufferReader(self.view, "little")
+
+		if reader.ReadBytes(4) != b"ESFM":
+			raise Exception("mapping was invalid")
+
+		reader.ReadBytes(2)
+
+		if reader.ReadBytes(2) != COMPILED_VERSION:
+			raise Exception("incompatible mapping")
+
+		reader.ReadBytes(2)
+
+		self.game = reader.ReadBytes(reader.ReadUInt8()).decode("utf-8")
+		self.version = reader.ReadInt8()
+
+		infos = {
+			"game": GAMES[self.game],
+			"version": ".".join(list(str(self.version)))
+		}
+
+		self.key_size = 3 + reader.ReadUInt8()
+		self.n_keys = reader.ReadUInt32()
+		self.n_buckets = reader.ReadUInt32()
+		self.n_music = reader.ReadUInt32()
+
+		sectors = {}
+		for name in COMPILED_SECTORS:
+			start, size = reader.ReadULongLong(), reader.ReadULongLong()
+			sectors[name] = self.view[start:start+size]
+
+		self.seeds = sectors["seeds"]
+		self.slots = sectors["slots"]
+		self.music = sectors["music"]
+		self.text = sectors["text"]
+
+		# languages are a handful of bytes, everything else stays in the file
+		languages = sectors["languages"]
+		self.languages = []
+		pos = 1
+		for i in range(languages[0]):
+			size = languages[pos]
+			self.languages.append(bytes(languages[pos+1:pos+1+size]).decode("utf-8"))
+			pos += 1 + size
+		languages.release()
+
+		if quiet:
+			return
+
+		print(f"> Loaded compiled mapping for {infos['game']} v{infos['version']}")
+		print(f"=-=-= Voicelines sector =-=-=")
+		print(f": {len(self.languages)} languages")
+		print(f": {self.n_keys} keys")
+		if self.n_music > 0:
+			print(f": {self.n_music} musics")
+
+	def key_value(self, key):
+		try:
+			raw = bytes.fromhex(key)
+		except ValueError:
+			return None
+
+		if len(raw) != self.key_size - 3 or raw.hex() != key:
+			return None
+
+		return int.from_bytes(raw, "big")
+
+	def find_slot(self, value):
+		# key, offset and size of the name, language
+		if self.n_keys == 0:
+			return None
+
+		seed = SEED.unpack_from(self.seeds, (key_hash(value, 0) % self.n_buckets) * SEED.size)[0]
+		if seed & DIRECT_SLOT:
+			position = seed & ~DIRECT_SLOT
+		else:
+			position = key_hash(value, seed) % self.n_keys
+
+		slot = SLOT.unpack_from(self.slots, position * SLOT.size)
+		if slot[0] != value:
+			return None
+
+		return slot
+
+	def find_music(self, key):
+		# music keys are decimal, sorted in their own sector
+		if self.n_music == 0 or not key.isdigit() or str(int(key)) != key:
+			return None
+
+		value = int(key)
+		low, high = 0, self.n_music
+		while low < high:
+			middle = (low + high) // 2
+			if MUSIC_SLOT.unpack_from(self.music, middle * MUSIC_SLOT.size)[0] < value:
+				low = middle + 1
+			else:
+				high = middle
+
+		if low == self.n_music:
+			return None
+
+		music_key, offset, size = MUSIC_SLOT.unpack_from(self.music, low * MUSIC_SLOT.size)
+		if music_key != value:
+			return None
+
+		return self.get_text(offset, size)
+
+	def get_text(self, offset, size):
+		return str(self.text[offset:offset+size], "utf-8")
+
+	def key_names(self):
+		# every mapped key, in slot order
+		return [e.to_bytes(self.key_size - 3, "big").hex() for e in self.key_values()]
+
+	def key_values(self):
+		# key_names as integers
+		return [slot[0] for slot in SLOT.iter_unpack(self.slots)]
+
+	def get_key(self, key, lang=False):
+		# the language is appended whenever the record has one, like Mapper
+		music = self.find_music(key)
+		if music is not None:
+			return [music, ""]
+
+		value = self.key_value(key)
+		if value is None:
+			return None
+
+		slot = self.find_slot(value)
+		if slot is None:
+			return None
+
+		name = [self.get_text(slot[1], slot[2])]
+		if slot[3]:
+			name.append(self.languages[slot[3]])
+
+		return name
+
+	def get_keys(self, keys, lang=False):
+		# names shared by several keys are only decoded once
+		results = []
+		names = {}
+
+		for key in keys:
+			music = self.find_music(key)
+			if music is not None:
+				results.append([music, ""])
+				continue
+
+			value = self.key_value(key)
+			slot = self.find_slot(value) if value is not None else None
+			if slot is None:
+				results.append(None)
+				continue
+
+			if slot[1] not in names:
+				names[slot[1]] = self.get_text(slot[1], slot[2])
+
+			results.append([names[slot[1]], self.languages[slot[3]]] if slot[3] else [names[slot[1]]])
+
+		return results
+
+	def reset(self):
+		self.languages.clear()
+		self.n_keys = self.n_music = 0
+
+		for view in [self.seeds, self.slots, self.music, self.text, self.view]:
+			view.release()
+		self.seeds = self.slots = self.music = self.text = self.view = memoryview(b"")
+		self.data.close()
@@ -0,0 +1,118 @@
+# platinum 4-bit adpcm decoder, tables and frame layout from vgmstream's ptadpcm_decoder.c
+# frames are independent (each starts with its own history and index), so they are all decoded side by side
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# frame groups (one frame per channel) decoded at once, keeps memory bounded on long files
+BATCH_GROUPS = 0x1000
+
+def build_tables():
+	# [index][nibble] -> step and next index, rows after the second one are the second one doubled each time
+	steps = [[-14, -10, -7, -5, -3, -2, -1, 0, 0, 1, 2, 3, 5, 7, 10, 14]]
+	indexes = [[2, 2, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 2, 2]]
+
+	row_steps = [-28, -20, -14, -10, -7, -5, -3, -1, 1, 3, 5, 7, 10, 14, 20, 28]
+	row_indexes = [3, 3, 2, 2, 1, 1, 1, 0, 0, 1, 1, 1, 2, 2, 3, 3]
+
+	for i in range(1, 16):
+		steps.append([e * (1 << (i - 1)) for e in row_steps])
+		indexes.append([min(e + i - 1, 15) for e in row_indexes])
+
+	return steps, indexes
+
+STEPS, INDEXES = build_tables()
+
+def samples_per_frame(frame_size):
+	# two header samples, then two samples per byte after the 5 bytes header
+	return 2 + (frame_size - 0x05) * 2
+
+def decode(data, channels, frame_size, num_samples):
+	# data is the wem data chunk, frame_size the interleave block size of a single channel
+	# yields interleaved little endian 16 bits pcm, batch by batch
+	if frame_size <= 0x05 or channels == 0:
+		raise Exception(f"invalid ptadpcm frame size {frame_size}")
+
+	group_size = frame_size * channels
+	groups = -(-len(data) // group_size)
+	spf = samples_per_frame(frame_size)
+	remaining = num_samples
+
+	for start in range(0, groups, BATCH_GROUPS):
+		if remaining <= 0:
+			break
+
+		end = min(start + BATCH_GROUPS, groups)
+		chunk = bytes(data[start*group_size:end*group_size])
+		# last group may be cut, missing bytes decode as zeros like in vgmstream
+		chunk += bytes((end - start) * group_size - len(chunk))
+
+		if np is None:
+			pcm = decode_python(chunk, channels, frame_size, spf)
+		else:
+			pcm = decode_numpy(chunk, channels, frame_size, spf)
+
+		count = min(remaining, (end - start) * spf)
+		remaining -= count
+		yield pcm[:count * channels * 2]
+
+def decode_python(chunk, channels, frame_size, spf):
+	# reference implementation, one frame at a time
+	groups = len(chunk) // (frame_size * channels)
+	out = [0] * (groups * spf * channels)
+
+	for group in range(groups):
+		for channel in range(channels):
+			offset = (group * channels + channel) * frame_size
+			hist2 = int.from_bytes(chunk[offset:offset+2], "little", signed=True)
+			hist1 = int.from_bytes(chunk[offset+2:offset+4], "little", signed=True)
+			index = min(chunk[offset+4], 15)
+
+			pos = (group * spf) * channels + channel
+			out[pos] = hist2
+			out[pos + channels] = hist1
+			pos += channels * 2
+
+			for byte in chunk[offset+5:offset+frame_size]:
+				# low nibble first
+				for nibble in [byte & 0x0F, byte >> 4]:
+					step = STEPS[index][nibble]
+					index = INDEXES[index][nibble]
+					sample = max(-32768, min(32767, step + 2 * hist1 - hist2))
+					out[pos] = sample
+					pos += channels
+					hist2, hist1 = hist1, sample
+
+	return b"".join([e.to_bytes(2, "little", signed=True) for e in out])
+
+def decode_numpy(chunk, channels, frame_size, spf):
+	# same as decode_python, every frame of the batch advances one nibble per step
+	frames = np.frombuffer(chunk, dtype=np.uint8).reshape(-1, channels, frame_size)
+	steps = np.array(STEPS, dtype=np.int32)
+	indexes = np.array(INDEXES, dtype=np.intp)
+
+	header = frames[:, :, 0:4].copy().view("<i2").astype(np.int32)
+	hist2 = header[:, :, 0]
+	hist1 = header[:, :, 1]
+	index = np.minimum(frames[:, :, 4], 15).astype(np.intp)
+
+	nibbles = np.empty(frames.shape[:2] + (frame_size - 0x05, 2), dtype=np.intp)
+	nibbles[..., 0] = frames[:, :, 5:] & 0x0F
+	nibbles[..., 1] = frames[:, :, 5:] >> 4
+	nibbles = nibbles.reshape(frames.shape[:2] + (-1,))
+
+	out = np.empty(frames.shape[:2] + (spf,), dtype="<i2")
+	out[:, :, 0] = hist2
+	out[:, :, 1] = hist1
+
+	for i in range(spf - 2):
+		nibble = nibbles[:, :, i]
+		sample = steps[index, nibble] + 2 * hist1 - hist2
+		np.clip(sample, -32768, 32767, out=sample)
+		index = indexes[index, nibble]
+		out[:, :, i + 2] = sample
+		hist2, hist1 = hist1, sample
+
+	# groups x channels x samples to samples x channels
+	return out.transpose(0, 2, 1).tobytes()
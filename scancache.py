@@ -0,0 +1,85 @@
+# persistent cache of scanned packages, unchanged packages are not scanned again on the next launch
+import os
+import json
+import zlib
+import sqlite3
+import hashlib
+from wavescan import WemIndex
+
+# bump when the stored index or metadata layout changes, older tables are simply ignored
+CACHE_VERSION = 3
+# size of the package prefix hashed along size and mtime, covers the akpk header
+HASH_SIZE = 0x10000
+# one blob per index column
+COLUMNS = list(WemIndex().columns().keys())
+
+
+class ScanCache:
+	def __init__(self, path):
+		self.path = path
+		self.table = f"packages_v{CACHE_VERSION}"
+		self.db = None
+		self.stamps = {}
+
+	def open(self):
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		self.db = sqlite3.connect(self.path)
+		self.db.execute(f"""
+			CREATE TABLE IF NOT EXISTS {self.table} (
+				path TEXT PRIMARY KEY,
+				lazy INTEGER,
+				size INTEGER,
+				mtime INTEGER,
+				hash BLOB,
+				strings TEXT,
+				{", ".join([f"{column} BLOB" for column in COLUMNS])},
+				metadata BLOB
+			)
+		""")
+
+	def close(self):
+		self.stamps.clear()
+		if self.db is not None:
+			db, self.db = self.db, None
+			try:
+				db.commit()
+			finally:
+				db.close()
+
+	def stamp(self, _input, lazy):
+		stat = os.stat(_input)
+		with open(_input, "rb") as f:
+			digest = hashlib.blake2b(f.read(HASH_SIZE), digest_size=16).digest()
+			f.close()
+		return int(lazy), stat.st_size, stat.st_mtime_ns, digest
+
+	def get(self, _input, relpath, lazy=False, metadata=True):
+		# returns (index, metadata) or None if the package is new or changed
+		# packages stored without metadata are only returned when it isn't needed
+		stamp = self.stamp(_input, lazy)
+		self.stamps[relpath] = stamp
+
+		row = self.db.execute(f"SELECT lazy, size, mtime, hash, strings, {', '.join(COLUMNS)}, metadata FROM {self.table} WHERE path = ?", (relpath,)).fetchone()
+		if row is None or tuple(row[0:4]) != stamp:
+			return None
+
+		stored = json.loads(zlib.decompress(row[-1]))
+		if stored is None and metadata:
+			return None
+
+		index = WemIndex()
+		index.strings = json.loads(row[4])
+		index.string_ids = {e: i for i, e in enumerate(index.strings)}
+		for column, blob in zip(index.columns().values(), row[5:-1]):
+			column.frombytes(blob)
+
+		return index, stored
+
+	def put(self, _input, relpath, result, lazy=False):
+		stamp = self.stamps.pop(relpath, None) or self.stamp(_input, lazy)
+		index, metadata = result
+
+		self.db.execute(
+			f"INSERT OR REPLACE INTO {self.table} VALUES ({', '.join(['?'] * (len(COLUMNS) + 7))})",
+			(relpath, *stamp, json.dumps(index.strings), *[column.tobytes() for column in index.columns().values()], zlib.compress(json.dumps(metadata).encode("utf-8")))
+		)
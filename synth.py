@@ -0,0 +1,263 @@
+# synthetic game installs, for benchmarking without shipping real packages
+# usage: python synth.py output_folder [--wems 10000] [--packages 4] [--data-size 256] [--languages english,japanese]
+import os
+import struct
+import random
+import argparse
+
+from vfs import decrypt, wem_seed
+
+LANGUAGES = [(0, "sfx"), (1, "english"), (2, "japanese")]
+# map vocabulary, kept small since map strings are addressed on 16 bits
+FOLDERS = ["vo_main", "vo_side", "vo_battle", "vo_world", "music", "sfx_ui"]
+SPEAKERS = ["endmin", "perlica", "chen", "wulfgard", "ember", "lifeng", "ardelia", "pogranichnik"]
+ACTIONS = ["greet", "idle", "attack", "skill", "hurt", "talk", "event"]
+
+### riff ###
+
+def make_wem(codec="PTADPCM", data_size=0x4000, channels=2, endianness="little", seed=0):
+	# riff header as written by wwise, fmt fields match what wwise.parse_wwise expects for each codec
+	rnd = random.Random(seed)
+	e = "<" if endianness == "little" else ">"
+
+	if codec == "PTADPCM":
+		fmt = struct.pack(f"{e}HHIIHHHI", 0x8311, channels, 48000, 0, 0x24 * channels, 4, 6, (1 << channels) - 1)
+	elif codec == "VORBIS":
+		# extra data holds samples, packet mode signal, setup/audio offsets and block size exponents
+		extra = bytearray(0x2A)
+		struct.pack_into(f"{e}II", extra, 0x00, 48000 * (data_size // 0x100 + 1), 0xD9)
+		struct.pack_into(f"{e}II", extra, 0x10, 0, 0x100)
+		extra[0x28:0x2A] = bytes([8, 11])
+		fmt = struct.pack(f"{e}HHIIHHHHI", 0xFFFF, channels, 48000, 0, 0, 0, 0x30, 0, (1 << channels) - 1) + bytes(extra)
+	else:
+		fmt = struct.pack(f"{e}HHIIHHH", 0x0001, channels, 48000, 48000 * channels * 2, channels * 2, 16, 0)
+
+	body = b"WAVE" + b"fmt " + struct.pack(f"{e}I", len(fmt)) + fmt
+	body += b"JUNK" + struct.pack(f"{e}I", 0x1C) + bytes(0x1C)
+	body += b"data" + struct.pack(f"{e}I", data_size) + rnd.randbytes(data_size)
+	return (b"RIFF" if endianness == "little" else b"RIFX") + struct.pack(f"{e}I", len(body)) + body
+
+def encrypt_wem(wem, name):
+	# vfs wems are keyed with their own id from the start of the wem, the keystream is its own inverse
+	wem = bytearray(wem)
+	decrypt(wem, 0, len(wem), wem_seed(name), 0)
+	return bytes(wem)
+
+### bnk ###
+
+def make_bnk(wems, endianness="little"):
+	# wems are (id, data), bank version is read by the scanner at 0x08
+	e = "<" if endianness == "little" else ">"
+	bkhd = struct.pack(f"{e}II", 0x8C, 0x1234) + bytes(0x10)
+	didx = bytearray()
+	data = bytearray()
+
+	for wem_id, wem in wems:
+		data += bytes(-len(data) % 16)
+		didx += struct.pack("<III", wem_id, len(data), len(wem))
+		data += wem
+
+	return b"BKHD" + struct.pack("<I", len(bkhd)) + bkhd + b"DIDX" + struct.pack("<I", len(didx)) + bytes(didx) + b"DATA" + struct.pack("<I", len(data)) + bytes(data)
+
+### akpk ###
+
+def make_akpk(sounds, banks=(), externals=(), endianness="little", langs=LANGUAGES, vfs=False):
+	# sounds and banks are (id, data, lang), externals are (64 bits id, data, lang)
+	# vfs packages get their header and every wem encrypted, the same way as endfield .chk files
+	e = "<" if endianness == "little" else ">"
+
+	lang_sector = bytearray(struct.pack(f"{e}I", len(langs)))
+	strings = bytearray()
+	for lang_id, name in langs:
+		lang_sector += struct.pack(f"{e}II", 4 + 8 * len(langs) + len(strings), lang_id)
+		strings += name.encode("utf-8").ljust(0x10, b"\x00")
+	lang_sector += strings
+
+	sizes = [len(lang_sector), 4 + 0x14 * len(banks), 4 + 0x14 * len(sounds), 4 + 0x18 * len(externals)]
+	header_size = 0x14 + sum(sizes)
+	payload = bytearray()
+
+	def place(data):
+		payload.extend(bytes(-(8 + header_size + len(payload)) % 16))
+		offset = 8 + header_size + len(payload)
+		payload.extend(data)
+		return offset
+
+	tables = bytearray()
+	for entries, ext in [(banks, None), (sounds, "{}.wem")]:
+		tables += struct.pack(f"{e}I", len(entries))
+		for file_id, data, lang in entries:
+			if vfs and ext is not None:
+				data = encrypt_wem(data, ext.format(file_id))
+			tables += struct.pack(f"{e}IIiii", file_id, 0, len(data), place(data), lang)
+
+	tables += struct.pack(f"{e}I", len(externals))
+	for file_id, data, lang in externals:
+		if vfs:
+			data = encrypt_wem(data, f"{file_id:016x}.wem")
+		# externals ids are stored as two halves, low half first in little endian
+		halves = [file_id & 0xFFFFFFFF, file_id >> 32] if endianness == "little" else [file_id >> 32, file_id & 0xFFFFFFFF]
+		tables += struct.pack(f"{e}IIIiii", *halves, 0, len(data), place(data), lang)
+
+	header = bytearray(b"AKPK" + struct.pack(f"{e}II", header_size, 1) + struct.pack(f"{e}4I", *sizes))
+	package = header + lang_sector + tables
+
+	if vfs:
+		if endianness != "little":
+			raise Exception("vfs packages are always little endian")
+		package[0:4] = b":)xD"
+		package[8:12] = bytes(4)
+		decrypt(package, 12, header_size - 4, header_size, 0)
+
+	return bytes(package + payload)
+
+### map ###
+
+def make_map(entries, langs=("english", "japanese"), game="beyond", version=10):
+	# entries are (key hex, lang index, name), names are folders split by \ and words split by _
+	# layout follows Mapper.process_map, an ESFM v31 file with relative sector offsets
+	def xored(string):
+		raw = string.encode("utf-8")
+		return bytes([len(raw)]) + bytes([b ^ (0x97 + len(raw)) for b in raw])
+
+	strings, string_ids = bytearray(), {}
+	words, word_ids = bytearray(), {}
+	files, file_ids = bytearray(), {}
+	keys = bytearray()
+
+	def string_offset(string):
+		if string not in string_ids:
+			string_ids[string] = len(strings)
+			if string.isdigit() and str(int(string)) == string:
+				# numbers are stored as integers, size is offset by 128
+				size = max(1, (int(string).bit_length() + 7) // 8)
+				strings.extend(bytes([128 + size]) + int(string).to_bytes(size, "big"))
+			else:
+				strings.extend(xored(string))
+			if len(strings) > 0xFFFF:
+				raise Exception("too many strings for the map format")
+		return string_ids[string]
+
+	def word_offset(word):
+		if word not in word_ids:
+			parts = word.split("_")
+			word_ids[word] = len(words)
+			words.extend(bytes([len(parts)]) + b"".join([string_offset(e).to_bytes(2, "big") for e in parts]))
+		return word_ids[word]
+
+	def file_offset(name):
+		if name not in file_ids:
+			parts = name.split("\\")
+			file_ids[name] = len(files)
+			files.extend(bytes([len(parts)]) + b"".join([word_offset(e).to_bytes(3, "big") for e in parts]))
+			if file_ids[name] > 0x3FFFFF:
+				raise Exception("too many files for the map format")
+		return file_ids[name]
+
+	key_size = None
+	for key, lang, name in entries:
+		key = bytes.fromhex(key)
+		if key_size is None:
+			key_size = 3 + len(key)
+		keys.extend(((lang << 22) | file_offset(name)).to_bytes(3, "big") + key)
+
+	if len(langs) > 4:
+		raise Exception("too many languages for the map format")
+	languages = bytes([len(langs)]) + b"".join([xored(e) for e in langs])
+	keys = bytes([key_size or 3]) + keys
+
+	sectors = [languages, bytes(strings), bytes(words), bytes(files), keys, b""]
+
+	def int24(value):
+		if value >= 0xFFFFFF:
+			return b"\xFF" * 3 + value.to_bytes(4, "big")
+		return value.to_bytes(3, "big")
+
+	table = bytearray()
+	pos = 0
+	for sector in sectors:
+		table += int24(pos) + int24(len(sector))
+		pos += len(sector)
+
+	header = b"ESFM" + bytes(2) + b"31" + bytes(2) + bytes([len(game)]) + game.encode("utf-8") + bytes([version])
+	return header + bytes(table) + b"".join(sectors)
+
+### install ###
+
+def generate_install(output, wems=10000, packages=4, data_size=0x100, banks=2, bank_wems=16, seed=0, languages=LANGUAGES):
+	# packages cycle between little endian, big endian and vfs variants, externals are the mapped ones
+	# languages are (id, name), the first one is sfx and stays out of the map
+	# returns the package paths, the map path and the total size written
+	rnd = random.Random(seed)
+	os.makedirs(output, exist_ok=True)
+
+	variants = [("little", False, "pck"), ("big", False, "pck"), ("little", True, "chk")]
+	codecs = ["PTADPCM", "VORBIS"]
+
+	written = []
+	entries = []
+	total = 0
+	next_id = 1000
+
+	def wem(endianness):
+		return make_wem(rnd.choice(codecs), rnd.randint(data_size // 2, data_size * 2) & ~3, rnd.choice([1, 2]), endianness, rnd.getrandbits(32))
+
+	for i in range(packages):
+		endianness, vfs, ext = variants[i % len(variants)]
+		quota = wems // packages + (1 if i < wems % packages else 0)
+
+		# bank children first, the rest is split between sounds and externals
+		package_banks = []
+		for j in range(min(banks, quota // bank_wems)):
+			children = [(next_id + k, wem(endianness)) for k in range(bank_wems)]
+			package_banks.append((next_id + bank_wems, make_bnk(children, endianness), 0))
+			next_id += bank_wems + 1
+			quota -= bank_wems
+
+		sounds = []
+		for j in range(quota // 2):
+			sounds.append((next_id, wem(endianness), rnd.choice(languages)[0]))
+			next_id += 1
+
+		externals = []
+		for j in range(quota - len(sounds)):
+			file_id = rnd.getrandbits(64) | (0xA << 60) # keeps the hex name from parsing as decimal
+			lang = rnd.randint(1, len(languages) - 1)
+			externals.append((file_id, wem(endianness), lang))
+
+			name = f"{rnd.choice(FOLDERS)}\\{rnd.choice(SPEAKERS)}\\{rnd.choice(SPEAKERS)}_{rnd.choice(ACTIONS)}_{rnd.randint(0, 999)}_{rnd.randint(0, 99)}"
+			entries.append([f"{file_id:016x}", lang - 1, name])
+
+		package = make_akpk(sounds, package_banks, externals, endianness, languages, vfs)
+		package_path = os.path.join(output, f"{i:08X}.{ext}")
+		with open(package_path, "wb") as f:
+			f.write(package)
+			f.close()
+
+		written.append(package_path)
+		total += len(package)
+
+	map_path = os.path.join(output, "synth.map")
+	with open(map_path, "wb") as f:
+		f.write(make_map(entries, [e[1] for e in languages[1:]]))
+		f.close()
+
+	return written, map_path, total
+
+def main():
+	parser = argparse.ArgumentParser(description="AnimeWwise synthetic install generator")
+	parser.add_argument("output", help="folder to write the packages and map to")
+	parser.add_argument("--wems", type=int, default=10000, help="total number of wems, bank children included")
+	parser.add_argument("--packages", type=int, default=4, help="number of packages")
+	parser.add_argument("--data-size", type=int, default=0x100, help="average size of a wem data chunk")
+	parser.add_argument("--banks", type=int, default=2, help="banks per package")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--languages", default=",".join([e[1] for e in LANGUAGES[1:]]), help="comma separated voice languages, sfx is always added first")
+	args = parser.parse_args()
+
+	languages = [(0, "sfx"), *enumerate(args.languages.split(","), 1)]
+	files, map_path, total = generate_install(args.output, args.wems, args.packages, args.data_size, args.banks, seed=args.seed, languages=languages)
+	print(f"wrote {len(files)} packages ({total / 0x100000:.1f} MB) and {map_path}")
+
+if __name__ == "__main__":
+	main()
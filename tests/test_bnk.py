@@ -0,0 +1,36 @@
+import struct
+
+import pytest
+
+from bnk import bnk2wem
+from synth import make_bnk
+
+wems = [(100 + i, bytes([i]) * (10 + i)) for i in range(3)]
+bank = make_bnk(wems)
+# bkhd chunk, then didx
+didx = 8 + struct.unpack_from("<I", bank, 4)[0]
+
+
+def test_offsets():
+	base = 0x1000
+	result = bnk2wem(memoryview(bank), "test", base)
+	assert [e[0] for e in result] == [e[0] for e in wems]
+	for (wem_id, offset, size), (_, data) in zip(result, wems):
+		assert bank[offset-base:offset-base+size] == data
+
+def test_no_wems():
+	assert bnk2wem(make_bnk([]), "test") == []
+
+@pytest.mark.parametrize("size", [0, 4, 8, didx, didx + 7, didx + 8, didx + 20, didx + 8 + 12 * 3 + 7])
+def test_truncated(size, capsys):
+	# every cut before the data chunk header is rejected without reading past the end
+	assert bnk2wem(bank[:size], "test") == []
+	assert "[WARNING]" in capsys.readouterr().out
+
+def test_signatures(capsys):
+	assert bnk2wem(b"XXXX" + bank[4:], "test") == []
+	assert bnk2wem(bank[:didx] + b"HIRC" + bank[didx+4:], "test") == []
+
+	data_chunk = didx + 8 + 12 * len(wems)
+	assert bnk2wem(bank[:data_chunk] + b"XXXX" + bank[data_chunk+4:], "test") == []
+	assert capsys.readouterr().out.count("[WARNING]") == 3
@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import extract
+import mapcompiler
+from mapper import Mapper, open_map
+from synth import make_wem, encrypt_wem, generate_install
+
+
+@pytest.fixture
+def extractor():
+	extractor = extract.WwiseExtract()
+	yield extractor
+	extractor.allocator.free_mem()
+
+def load(extractor, tmp_path, data):
+	package = tmp_path / "package.pck"
+	package.write_bytes(bytes(7) + data)
+	extractor.allocator.load_file(str(package), "package.pck")
+	return {"source": "package.pck", "offset": 7, "size": len(data)}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_stream_encrypted(workers, extractor, tmp_path, monkeypatch):
+	# big encrypted wems go through the decrypt workers, small windows make sure streaming is exercised too
+	monkeypatch.setattr(extract, "PARALLEL_MIN_SIZE", 0x100)
+	wem = make_wem(data_size=0x3000, seed=1)
+	file = load(extractor, tmp_path, encrypt_wem(wem, "1234.wem"))
+	file["original_name"] = "1234.wem"
+
+	extractor.workers = workers
+	output = str(tmp_path / "out/1234.wem")
+	assert extractor.stream_wem(file, output, bytearray(0x400))
+	if extractor.decrypt_workers is not None:
+		extractor.decrypt_workers.shutdown()
+		extractor.decrypt_workers = None
+
+	with open(output, "rb") as f:
+		assert f.read() == wem
+
+@pytest.mark.parametrize("content", [b"not a database" * 100, b"SQLite format 3\x00" + bytes(200)])
+def test_corrupt_cache(content, extractor, tmp_path, capsys):
+	# a broken cache is skipped, the packages are still loaded
+	packages, map_path, size = generate_install(str(tmp_path / "install"), wems=40, packages=2)
+	cache = tmp_path / "scan.cache"
+	cache.write_bytes(content)
+	extractor.cache_path = str(cache)
+
+	structure = extractor.load_folder(None, packages, "", str(tmp_path / "install"), lambda e: None, 1)
+	assert len(structure["folders"]["unmapped"]["files"]) > 0
+	assert extractor.cache is None
+	assert capsys.readouterr().out.count("scan cache unavailable") == 1
+
+def bank_nodes(node):
+	for name, child in node["folders"].items():
+		if "bank" in child:
+			yield child
+		yield from bank_nodes(child)
+
+def test_expand_bank(extractor, tmp_path):
+	# banks fill their own node, concurrent expansions leave the loaded folder alone
+	install = str(tmp_path / "install")
+	packages, map_path, size = generate_install(install, wems=200, packages=3, banks=2, bank_wems=8)
+	extractor.cache_path = None
+	structure = extractor.load_folder(None, packages, "", install, lambda e: None, 1)
+	snapshot = repr(structure)
+
+	nodes = list(bank_nodes(structure))
+	assert len(nodes) == 6 and not any([e["bank"]["loaded"] for e in nodes])
+
+	with ThreadPoolExecutor(max_workers=4) as pool:
+		list(pool.map(extractor.expand_bank, nodes))
+
+	assert extractor.file_structure is structure
+	for node in nodes:
+		assert node["bank"]["loaded"]
+		assert len(node["folders"]["unmapped"]["files"]) == 8
+	# only the bank nodes changed
+	for node in nodes:
+		node["bank"]["loaded"] = False
+		node["folders"] = {}
+	assert repr(structure) == snapshot
+
+def count_files(node):
+	return len(node["files"]) + sum([count_files(e) for e in node["folders"].values()])
+
+def test_generate_languages(extractor, tmp_path):
+	# custom voice languages end up in the map and every external is named after one of them
+	install = str(tmp_path / "install")
+	languages = [(0, "sfx"), (1, "english"), (2, "chinese"), (3, "korean")]
+	packages, map_path, size = generate_install(install, wems=60, packages=3, banks=0, languages=languages)
+	mapper = Mapper(map_path, quiet=True)
+	assert mapper.languages == ["english", "chinese", "korean"]
+
+	extractor.cache_path = None
+	extractor.maps["synth"] = mapper
+	structure = extractor.load_folder("synth.map", packages, "", install, lambda e: None, 1)
+	# half of each package is externals, all of them mapped
+	mapped = sum([count_files(child) for name, child in structure["folders"].items() if name != "unmapped"])
+	assert mapped == 30 and len(structure["folders"]["unmapped"]["files"]) == 30
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_parallel_shared_map(compiled, extractor, tmp_path, monkeypatch):
+	# load workers resolve names from the published map, the structure matches a serial load
+	install = str(tmp_path / "install")
+	packages, map_path, size = generate_install(install, wems=200, packages=3)
+	if compiled:
+		mapcompiler.compile_map(map_path, str(tmp_path / "synth.cmap"))
+		map_path = str(tmp_path / "synth.cmap")
+	extractor.cache_path = None
+
+	extractor.maps["synth"] = open_map(map_path, quiet=True)
+	serial = repr(extractor.load_folder("synth.map", packages, "", install, lambda e: None, 1))
+	assert extractor.shared_maps == {}
+
+	resolved = []
+	load_scan = extractor.load_scan
+	def record(*args, keys=None, **kwargs):
+		resolved.append(keys)
+		return load_scan(*args, keys=keys, **kwargs)
+	monkeypatch.setattr(extractor, "load_scan", record)
+
+	parallel = repr(extractor.load_folder("synth.map", packages, "", install, lambda e: None, 2))
+	assert parallel == serial
+	assert len(resolved) == 3 and all([e is not None for e in resolved])
+	assert list(extractor.shared_maps) == ["synth"]
+
+	extractor.reset()
+	assert extractor.shared_maps == {}
@@ -0,0 +1,45 @@
+import io
+import struct
+
+import pytest
+
+from filereader import BufferReader, FileReader, ARRAY_STRUCTS
+from vfs import OverlayView
+
+data = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("endianness", ["little", "big"])
+@pytest.mark.parametrize("buffer", [data, memoryview(data), bytearray(data), OverlayView(bytearray(data[:10]), data)])
+def test_read_array(endianness, buffer):
+	reader = BufferReader(buffer, endianness)
+	expected = FileReader(io.BytesIO(data), endianness)
+
+	reader.SetBufferPos(3)
+	expected.SetBufferPos(3)
+	assert reader.ReadArray("I", 5) == [expected.ReadUInt32() for i in range(5)]
+	assert reader.GetBufferPos() == 23
+
+	rows = reader.ReadArray("IhQ", 4)
+	assert rows == [(expected.ReadUInt32(), expected.ReadInt16(), expected.ReadULongLong()) for i in range(4)]
+	assert reader.GetBufferPos() == 23 + 4 * 14
+
+def test_read_array_options():
+	reader = BufferReader(data, "little")
+	# positional reads leave the position alone, the byte order can be overridden per call
+	assert reader.ReadArray("H", 2, pos=1) == [0x0201, 0x0403]
+	assert reader.ReadArray("H", 2, "big", pos=1) == [0x0102, 0x0304]
+	assert reader.GetBufferPos() == 0
+	assert reader.ReadArray("I", 0) == []
+
+	# same formats share a struct whatever the count
+	reader.ReadArray("Iq", 1, pos=0)
+	size = len(ARRAY_STRUCTS)
+	for count in range(2, 50):
+		reader.ReadArray("Iq", count, pos=0)
+	assert len(ARRAY_STRUCTS) == size
+
+def test_read_array_truncated():
+	reader = BufferReader(data, "little")
+	with pytest.raises(struct.error):
+		reader.ReadArray("I", 2, pos=len(data) - 7)
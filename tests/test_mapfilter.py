@@ -0,0 +1,20 @@
+import mapfilter
+from synth import make_map
+
+
+def test_detect_map(tmp_path):
+	keys = [f"{0xA000000000000000 | i * 7919:016x}" for i in range(500)]
+	paths = []
+	for name, known in [("a.map", keys[:250]), ("b.map", keys[100:])]:
+		path = tmp_path / name
+		path.write_bytes(make_map([[e, 0, "vo_main\\line"] for e in known]))
+		paths.append(str(path))
+
+	filters = mapfilter.get_filters(paths)
+	assert (tmp_path / "a.bloom").is_file()
+
+	# decimal ids and keys of another size can't be looked up in these maps
+	ids = keys[200:] + ["1234", "abcd"]
+	assert mapfilter.probe_count(filters, ids) == 300
+	assert mapfilter.detect_map(filters, ids)[0] == paths[1]
+	assert mapfilter.detect_map(filters, [f"{i:016x}" for i in range(100)])[0] is None
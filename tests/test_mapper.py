@@ -0,0 +1,99 @@
+import os
+import random
+
+import pytest
+
+import mapcompiler
+from mapper import Mapper, CompiledMapper, open_map, publish_map, attach_map
+from synth import make_map
+
+
+@pytest.fixture
+def map_path(tmp_path):
+	rnd = random.Random(0)
+	entries = []
+	for i in range(2000):
+		name = f"vo_{rnd.choice(['main', 'side'])}\\speaker{rnd.randint(0, 20)}\\line_{rnd.randint(0, 500)}_{i % 7}"
+		entries.append([f"{rnd.getrandbits(64):016x}", rnd.randint(0, 1), name])
+	# last duplicate wins
+	entries.append([entries[10][0], 1, "vo_main\\duplicate"])
+
+	path = tmp_path / "test.map"
+	path.write_bytes(make_map(entries))
+	return str(path), entries
+
+@pytest.fixture
+def compiled_path(map_path, tmp_path):
+	path = str(tmp_path / "test.cmap")
+	mapcompiler.compile_map(map_path[0], path)
+	return path
+
+
+def test_compiled_lookups(map_path, compiled_path):
+	source = Mapper(map_path[0], quiet=True)
+	compiled = CompiledMapper(compiled_path, quiet=True)
+	try:
+		keys = [e[0] for e in map_path[1]]
+		# misses, wrong sizes, uppercase and non hex keys
+		keys += [f"{e:016x}" for e in range(100)] + ["00", keys[0].upper(), "not a key", keys[0] + "00"]
+
+		assert [compiled.get_key(e) for e in keys] == [source.get_key(e) for e in keys]
+		assert compiled.get_keys(keys) == source.get_keys(keys)
+		assert compiled.get_key(map_path[1][10][0]) == ["vo_main\\duplicate", "japanese"]
+		assert sorted(compiled.key_names()) == sorted(set(source.key_names()))
+	finally:
+		source.reset()
+		compiled.reset()
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_shared(compiled, map_path, compiled_path):
+	# an attached map reads the published segment and answers like the original
+	mapper = open_map(compiled_path if compiled else map_path[0], quiet=True)
+	shared, handle = publish_map(mapper)
+	attached = attach_map(handle)
+	try:
+		assert isinstance(attached, CompiledMapper if compiled else Mapper)
+		keys = [e[0] for e in map_path[1]] + [f"{e:016x}" for e in range(100)]
+		assert attached.get_keys(keys) == mapper.get_keys(keys)
+	finally:
+		attached.reset()
+		mapper.reset()
+		shared.close()
+		shared.unlink()
+
+def test_quiet(map_path, compiled_path, capsys):
+	for path in [map_path[0], compiled_path]:
+		open_map(path, quiet=True).reset()
+	assert capsys.readouterr().out == ""
+
+	open_map(compiled_path).reset()
+	assert "compiled mapping" in capsys.readouterr().out
+
+def test_is_compiled(map_path, compiled_path):
+	assert mapcompiler.is_compiled(map_path[0], compiled_path)
+
+	# compiled by an older version of the format
+	with open(compiled_path, "r+b") as f:
+		f.seek(6)
+		f.write(b"39")
+		f.close()
+	assert not mapcompiler.is_compiled(map_path[0], compiled_path)
+
+	# source changed after the compile
+	mapcompiler.compile_map(map_path[0], compiled_path)
+	os.utime(map_path[0], (os.path.getmtime(compiled_path) + 10,) * 2)
+	assert not mapcompiler.is_compiled(map_path[0], compiled_path)
+
+def test_names(tmp_path):
+	# empty strings and numbers are decoded like any other string
+	entries = [["%016x" % (i + 1), i % 2, name] for i, name in enumerate(["vo\\a__b", "vo\\12_x", "vo\\a__b_c", "music\\0"])]
+	path = tmp_path / "names.map"
+	path.write_bytes(make_map(entries))
+
+	mapper = Mapper(str(path), quiet=True)
+	try:
+		for i in range(2):
+			assert [mapper.get_key(e[0]) for e in entries] == [[e[2], "japanese"] if e[1] else [e[2]] for e in entries]
+		assert mapper.string_table[0] == "vo"
+	finally:
+		mapper.reset()
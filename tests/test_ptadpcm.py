@@ -0,0 +1,70 @@
+import random
+import struct
+
+import pytest
+
+import wwise
+import ptadpcm
+from synth import make_wem
+
+# one 7 bytes frame per channel, history, index, then nibbles low first
+# expected pcm worked out by hand from vgmstream's ptadpcm_table and decode_ptadpcm
+GOLDEN_FRAMES = [
+	struct.pack("<hhB", -8, 4, 1) + bytes([0x8F, 0x30]),
+	# index 15 steps clip both ways
+	struct.pack("<hhB", -32000, 32000, 15) + bytes([0xFF, 0x00])
+]
+GOLDEN_PCM = [
+	[-8, 4, 44, 88, 76, -16],
+	[-32000, 32000, 32767, 32767, -32768, -32768]
+]
+
+
+@pytest.mark.parametrize("numpy", [False, True])
+def test_golden(numpy, monkeypatch):
+	if numpy:
+		pytest.importorskip("numpy")
+	else:
+		monkeypatch.setattr(ptadpcm, "np", None)
+
+	# mono frames, then both as one stereo group
+	for frame, pcm in zip(GOLDEN_FRAMES, GOLDEN_PCM):
+		assert b"".join(ptadpcm.decode(frame, 1, 0x07, 6)) == struct.pack("<6h", *pcm)
+
+	interleaved = [e for pair in zip(*GOLDEN_PCM) for e in pair]
+	assert b"".join(ptadpcm.decode(b"".join(GOLDEN_FRAMES), 2, 0x07, 6)) == struct.pack("<12h", *interleaved)
+
+@pytest.mark.parametrize("channels, extra", [(1, 0), (2, 0), (2, 0x30), (1, 0x23)])
+def test_num_samples(channels, extra):
+	# a cut last frame holds no samples
+	wem = make_wem("PTADPCM", 0x24 * channels * 5 + extra, channels)
+	meta = wwise.parse_wwise(wem, "test", "1.wem")
+	assert meta["numSamples"] == 5 * ptadpcm.samples_per_frame(0x24)
+
+
+@pytest.mark.parametrize("channels, frame_size", [(1, 0x06), (1, 0x8A), (2, 0x8A), (6, 0x45)])
+def test_numpy_matches_python(channels, frame_size):
+	pytest.importorskip("numpy")
+	rnd = random.Random(channels * frame_size)
+	chunk = bytes([rnd.getrandbits(8) for i in range(frame_size * channels * 17)])
+	spf = ptadpcm.samples_per_frame(frame_size)
+
+	expected = ptadpcm.decode_python(chunk, channels, frame_size, spf)
+	assert ptadpcm.decode_numpy(chunk, channels, frame_size, spf) == expected
+	assert len(expected) == 17 * spf * channels * 2
+
+def test_decode(monkeypatch):
+	# several batches, a cut last group and a sample count ending mid frame
+	monkeypatch.setattr(ptadpcm, "BATCH_GROUPS", 3)
+	rnd = random.Random(0)
+	data = bytes([rnd.getrandbits(8) for i in range(0x8A * 2 * 10 - 50)])
+	num_samples = ptadpcm.samples_per_frame(0x8A) * 9 + 7
+
+	result = b"".join(ptadpcm.decode(data, 2, 0x8A, num_samples))
+	monkeypatch.setattr(ptadpcm, "np", None)
+	assert b"".join(ptadpcm.decode(data, 2, 0x8A, num_samples)) == result
+	assert len(result) == num_samples * 2 * 2
+
+def test_invalid_frame_size():
+	with pytest.raises(Exception):
+		list(ptadpcm.decode(bytes(10), 1, 0x05, 10))
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import wavescan
+from scancache import ScanCache
+from synth import make_akpk, make_wem
+
+
+@pytest.fixture
+def package(tmp_path):
+	path = tmp_path / "00000000.pck"
+	path.write_bytes(make_akpk([(i, make_wem(data_size=0x40, seed=i), 0) for i in range(5)]))
+	return str(path)
+
+@pytest.fixture
+def cache(tmp_path):
+	cache = ScanCache(str(tmp_path / "cache/scan.cache"))
+	cache.open()
+	yield cache
+	cache.close()
+
+def scan(path):
+	with open(path, "rb") as f:
+		return wavescan.get_data(f.read(), os.path.basename(path)), [{"codec": "PTADPCM"}] * 5
+
+
+def test_round_trip(package, cache):
+	index, metadata = scan(package)
+	assert cache.get(package, "a.pck") is None
+	cache.put(package, "a.pck", (index, metadata))
+
+	cached = cache.get(package, "a.pck")
+	assert list(cached[0]) == list(index)
+	assert cached[1] == metadata
+
+def test_invalidation(package, cache):
+	cache.put(package, "a.pck", scan(package))
+	stat = os.stat(package)
+
+	# other scan mode
+	assert cache.get(package, "a.pck", lazy=True) is None
+
+	# same size and mtime, but the header changed
+	with open(package, "r+b") as f:
+		f.seek(0x30)
+		value = f.read(1)
+		f.seek(0x30)
+		f.write(bytes([value[0] ^ 0xFF]))
+		f.close()
+	os.utime(package, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+	assert cache.get(package, "a.pck") is None
+
+	cache.put(package, "a.pck", scan(package))
+	assert cache.get(package, "a.pck") is not None
+
+	# touched
+	os.utime(package, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+	assert cache.get(package, "a.pck") is None
+
+	# grown
+	cache.put(package, "a.pck", scan(package))
+	with open(package, "ab") as f:
+		f.write(bytes(4))
+		f.close()
+	os.utime(package, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+	assert cache.get(package, "a.pck") is None
+
+def test_metadata(package, cache):
+	# scans stored without metadata only serve callers that don't need it
+	cache.put(package, "a.pck", (scan(package)[0], None))
+	assert cache.get(package, "a.pck") is None
+	assert cache.get(package, "a.pck", metadata=False)[1] is None
+
+def test_persistence(package, tmp_path):
+	cache = ScanCache(str(tmp_path / "cache/scan.cache"))
+	cache.open()
+	cache.put(package, "a.pck", scan(package))
+	cache.close()
+
+	cache.open()
+	try:
+		assert cache.get(package, "a.pck") is not None
+	finally:
+		cache.close()
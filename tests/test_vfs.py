@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import vfs
+
+np = pytest.importorskip("numpy")
+
+threshold = vfs.NUMPY_MIN_BLOCKS * 4
+cases = []
+rnd = random.Random(0)
+for length in [0, 1, 3, 5, threshold - 5, threshold - 1, threshold, threshold + 1, threshold + 7, 4099]:
+	for offset in [0, 1, 3, 5, 8, 13]:
+		cases.append((offset, length, rnd.randint(0, 1 << 40), rnd.randint(0, 1 << 20)))
+
+
+@pytest.mark.parametrize("offset, length, seed, file_offset", cases)
+def test_numpy_matches_python(offset, length, seed, file_offset):
+	data = bytearray(random.Random(length).randbytes(offset + length + 9))
+	expected = bytearray(data)
+	vfs.decrypt_python(expected, offset, length, seed, file_offset)
+
+	result = bytearray(data)
+	vfs.decrypt_numpy(result, offset, length, seed, file_offset)
+	assert result == expected
+
+	result = bytearray(data)
+	vfs.decrypt(result, offset, length, seed, file_offset)
+	assert result == expected
+
+def test_split():
+	# the keystream only depends on the file offset, so a payload can be decrypted piece by piece
+	data = bytearray(random.Random(1).randbytes(5000))
+	whole = bytearray(data)
+	vfs.decrypt(whole, 0, len(whole), 1234, 77)
+
+	for start, end in [(0, 3), (3, 1001), (1001, 5000)]:
+		vfs.decrypt(data, start, end - start, 1234, 77 + start)
+	assert data == whole
+
+@pytest.fixture(scope="module")
+def pool():
+	with vfs.decrypt_pool(2) as pool:
+		yield pool
+
+@pytest.mark.parametrize("offset, length, file_offset", [(0, 4096, 0), (3, 5001, 1), (1, 3, 2), (8, 777, 6)])
+def test_parallel(offset, length, file_offset, pool, monkeypatch):
+	monkeypatch.setattr(vfs, "PARALLEL_MIN_SIZE", 0)
+	data = bytearray(random.Random(length).randbytes(offset + length + 5))
+	expected = bytearray(data)
+	vfs.decrypt(expected, offset, length, 99, file_offset)
+
+	vfs.decrypt_parallel(data, offset, length, 99, file_offset, pool)
+	assert data == expected
+
+def test_parallel_small():
+	# under the threshold nothing is spawned
+	data = bytearray(range(256))
+	expected = bytearray(data)
+	vfs.decrypt(expected, 0, 256, 5, 0)
+	vfs.decrypt_parallel(data, 0, 256, 5, 0)
+	assert data == expected
@@ -0,0 +1,49 @@
+import struct
+
+import pytest
+
+import wav
+import extract
+from synth import make_wem
+
+
+def read_wav(path):
+	with open(path, "rb") as f:
+		data = f.read()
+	assert data[0:4] == b"RIFF" and data[8:16] == b"WAVE" + b"fmt "
+	assert struct.unpack_from("<I", data, 4)[0] == len(data) - 8
+	fmt_size = struct.unpack_from("<I", data, 16)[0]
+	fmt = struct.unpack_from("<HHIIHH", data, 20)
+	data_pos = 20 + fmt_size
+	assert data[data_pos:data_pos+4] == b"data"
+	size = struct.unpack_from("<I", data, data_pos + 4)[0]
+	return fmt, data[data_pos+8:data_pos+8+size]
+
+@pytest.mark.parametrize("endianness", ["little", "big"])
+@pytest.mark.parametrize("channels", [1, 2])
+def test_convert_pcm16(endianness, channels, tmp_path, monkeypatch):
+	# riff and rifx wems both come out as little endian riff, small blocks exercise the split
+	monkeypatch.setattr(wav, "COPY_BLOCK", 0x32)
+	wem = make_wem("PCM", 0x40 * channels, channels, endianness, seed=channels)
+	source = tmp_path / "1.wem"
+	source.write_bytes(wem)
+
+	extractor = extract.WwiseExtract()
+	try:
+		assert extractor.convert_wav(str(source), str(tmp_path / "1.wav"))
+	finally:
+		extractor.allocator.free_mem()
+
+	fmt, pcm = read_wav(tmp_path / "1.wav")
+	assert fmt == (0x0001, channels, 48000, 48000 * channels * 2, channels * 2, 16)
+
+	e = "<" if endianness == "little" else ">"
+	raw = wem[-0x40 * channels:]
+	samples = struct.unpack(f"{e}{len(raw) // 2}h", raw)
+	assert pcm == struct.pack(f"<{len(samples)}h", *samples)
+
+def test_pcm_blocks_odd():
+	# a trailing half sample is dropped when swapping
+	data = bytes(range(7))
+	assert b"".join(wav.pcm_blocks(data)) == data
+	assert b"".join(wav.pcm_blocks(data, True)) == bytes([1, 0, 3, 2, 5, 4])
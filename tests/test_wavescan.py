@@ -0,0 +1,60 @@
+import pytest
+
+import wavescan
+from synth import make_akpk, make_bnk, make_wem, encrypt_wem
+
+
+def package(endianness, vfs, banks):
+	sounds = [(100 + i, make_wem(data_size=0x40 + i, endianness=endianness, seed=i), i % 3) for i in range(4)]
+	externals = [((0xA << 60) | i, make_wem(data_size=0x30, endianness=endianness, seed=10 + i), 1) for i in range(3)]
+	children = [(200 + i, make_wem(data_size=0x20, endianness=endianness, seed=20 + i)) for i in range(2)]
+	bank_entries = [(300, make_bnk(children, endianness), 0)] if banks else []
+	data = make_akpk(sounds, bank_entries, externals, endianness, vfs=vfs)
+
+	expected = {}
+	for file_id, wem, lang in sounds:
+		expected[f"{file_id}.wem"] = encrypt_wem(wem, f"{file_id}.wem") if vfs else wem
+	for file_id, wem, lang in externals:
+		expected[f"{file_id:016x}.wem"] = encrypt_wem(wem, f"{file_id:016x}.wem") if vfs else wem
+	if banks:
+		for file_id, wem in children:
+			expected[f"300_{file_id}.wem"] = wem
+
+	return data, expected
+
+
+@pytest.mark.parametrize("endianness, vfs", [("little", False), ("big", False), ("little", True)])
+@pytest.mark.parametrize("banks", [False, True])
+def test_scan(endianness, vfs, banks):
+	data, expected = package(endianness, vfs, banks)
+	index = wavescan.get_data(data, "00000000.pck")
+
+	rows = {name: (offset, size, source) for name, offset, size, source in index}
+	assert sorted(rows) == sorted(expected)
+	for name, (offset, size, source) in rows.items():
+		assert source == "00000000.pck"
+		assert data[offset:offset+size] == expected[name]
+
+def test_lazy_banks():
+	data, expected = package("big", False, True)
+	scanner = wavescan.WaveScanner(lazy_banks=True)
+	index = scanner.scan(data, "a.pck")
+
+	assert not any([e[0].startswith("300_") for e in index])
+	banks = list(index.banks())
+	assert [e[0] for e in banks] == [300]
+
+	bank_index = scanner.scan_bank(data, "a.pck", *banks[0][:3])
+	for name, offset, size, source in bank_index:
+		assert data[offset:offset+size] == expected[name]
+
+def test_reuse():
+	# nothing carries over from one package to the next
+	scanner = wavescan.WaveScanner()
+	first = list(scanner.scan(package("big", False, True)[0], "a.pck"))
+	scanner.scan(package("little", True, False)[0], "b.pck")
+	assert list(scanner.scan(package("big", False, True)[0], "a.pck")) == first
+
+def test_invalid():
+	with pytest.raises(Exception):
+		wavescan.get_data(b"RIFF" + bytes(60), "a.pck")
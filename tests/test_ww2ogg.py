@@ -0,0 +1,93 @@
+import io
+import os
+import struct
+
+import pytest
+
+import ww2ogg
+import wwise
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+codebooks = os.path.join(root, "tools/ww2ogg/packed_codebooks_aoTuV_603.bin")
+# quarter second of mono 48kHz vorbis, its setup references the aoTuV codebooks
+sample = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/vorbis.wem")
+
+
+def reference_crc(data):
+	# bit by bit ogg crc, polynomial 0x04c11db7 without reflection, no initial value or final xor
+	crc = 0
+	for byte in data:
+		crc ^= byte << 24
+		for i in range(8):
+			crc = ((crc << 1) ^ 0x04C11DB7 if crc & 0x80000000 else crc << 1) & 0xFFFFFFFF
+	return crc
+
+def pages(data):
+	pos = 0
+	while pos < len(data):
+		assert data[pos:pos+4] == b"OggS"
+		count = data[pos+26]
+		size = 27 + count + sum(data[pos+27:pos+27+count])
+		yield data[pos:pos+size]
+		pos += size
+
+def packets(data):
+	current = b""
+	for page in pages(data):
+		count = page[26]
+		pos = 27 + count
+		for value in page[27:27+count]:
+			current += page[pos:pos+value]
+			pos += value
+			if value < 255:
+				yield current
+				current = b""
+
+def rebuild(data):
+	meta = wwise.parse_wwise(data, sample, os.path.basename(sample))
+	output = io.BytesIO()
+	ww2ogg.VorbisRebuilder(ww2ogg.CodebookLibrary(codebooks)).rebuild(data, meta, output)
+	return output.getvalue()
+
+
+@pytest.mark.parametrize("data", [b"", b"OggS", bytes(range(256)) * 3])
+def test_crc(data):
+	assert ww2ogg.OggWriter(None).crc(data) == reference_crc(data)
+
+def test_pages_crc():
+	output = io.BytesIO()
+	writer = ww2ogg.OggWriter(output)
+	# a packet spanning several pages and a lacing multiple of 255
+	writer.packet(bytes(range(256)) * 300, 0)
+	writer.packet(bytes(255 * 3), 1024, last=True)
+
+	for page in pages(output.getvalue()):
+		crc = struct.unpack_from("<I", page, 22)[0]
+		assert crc == reference_crc(page[:22] + bytes(4) + page[26:])
+
+def test_codebooks():
+	library = ww2ogg.CodebookLibrary(codebooks)
+	assert len(library.offsets) == 599
+	for codebook_id in range(len(library.offsets) - 1):
+		library.rebuild(codebook_id, ww2ogg.BitWriter())
+
+def test_load_library():
+	assert ww2ogg.load_library(os.path.join(root, "tools/ww2ogg/missing.bin")) is None
+	assert isinstance(ww2ogg.load_library(codebooks), ww2ogg.CodebookLibrary)
+
+def test_round_trip():
+	wem2ogg = pytest.importorskip("wem2ogg")
+	with open(sample, "rb") as f:
+		data = f.read()
+
+	expected = list(packets(wem2ogg.wem_to_ogg(data)))
+	result = list(packets(rebuild(data)))
+
+	# only the comment header differs, it holds the vendor string
+	assert len(result) == len(expected)
+	assert result[0] == expected[0]
+	assert result[2:] == expected[2:]
+
+	# ww2ogg ends on the last full block, the stream here is trimmed to the wem sample count
+	meta = wwise.parse_wwise(data, sample, os.path.basename(sample))
+	assert struct.unpack_from("<q", list(pages(rebuild(data)))[-1], 6)[0] == meta["numSamples"]
@@ -1,6 +1,82 @@
 # decrypt and parse endfield's .chk files for audio
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# below this many blocks numpy setup costs more than the plain loop
+NUMPY_MIN_BLOCKS = 64
+# keystream is built this many blocks at a time to keep memory bounded
+NUMPY_BATCH_BLOCKS = 1 << 20
+# payloads smaller than this are decrypted serially, handing them to workers isn't worth it
+PARALLEL_MIN_SIZE = 16 << 20
 
 def decrypt(data, offset, count, seed, fileOffset):
+	if np is None or count // 4 < NUMPY_MIN_BLOCKS:
+		decrypt_python(data, offset, count, seed, fileOffset)
+	else:
+		decrypt_numpy(data, offset, count, seed, fileOffset)
+
+def decrypt_parallel(data, offset, count, seed, fileOffset, pool=None):
+	# same as decrypt over several processes, data is copied once to shared memory and back
+	if count < PARALLEL_MIN_SIZE:
+		decrypt(data, offset, count, seed, fileOffset)
+		return
+
+	shm = shared_memory.SharedMemory(create=True, size=count)
+	try:
+		with memoryview(data) as view:
+			shm.buf[:count] = view[offset:offset+count]
+		decrypt_shared(shm, 0, count, seed, fileOffset, pool)
+		with memoryview(data) as view:
+			view[offset:offset+count] = shm.buf[:count]
+	finally:
+		shm.close()
+		shm.unlink()
+
+def decrypt_shared(shm, offset, count, seed, fileOffset, pool=None):
+	# decrypt part of a shared memory block in place, pool is a process pool kept by the caller or None for a temporary one
+	# segments are aligned on key blocks, each segment seed only depends on its file offset
+	workers = os.cpu_count() or 1
+	head = min((4 - (fileOffset & 3)) & 3, count)
+	step = max(((count - head) // workers + 3) & ~3, 4)
+	bounds = sorted(set([0, *range(head, count, step), count]))
+
+	segments = [(shm.name, offset + start, end - start, seed, fileOffset + start) for start, end in zip(bounds, bounds[1:])]
+	if pool is not None:
+		list(pool.map(decrypt_segment, segments))
+		return
+
+	with decrypt_pool() as pool:
+		list(pool.map(decrypt_segment, segments))
+
+def decrypt_pool(workers=None):
+	# workers are spawned, forking from the gui thread isn't safe
+	return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def decrypt_segment(segment):
+	# process pool entry point
+	name, start, count, seed, fileOffset = segment
+	shm = attach_shared(name)
+	try:
+		decrypt(shm.buf, start, count, seed, fileOffset)
+	finally:
+		shm.close()
+
+def attach_shared(name):
+	# shared memory made by another process, which owns it
+	try:
+		# 3.13+, attaching must not track the block or it would be removed when this process exits
+		return shared_memory.SharedMemory(name=name, track=False)
+	except TypeError:
+		return shared_memory.SharedMemory(name=name)
+
+def decrypt_python(data, offset, count, seed, fileOffset):
+	# reference implementation, one block at a time
 	keySeed = seed + (fileOffset >> 2)
 
 	dataIndex = offset
@@ -33,7 +109,7 @@ def decrypt(data, offset, count, seed, fileOffset):
 		data[dataIndex+1] = (dataValue >> 8) & 0xFF
 		data[dataIndex+2] = (dataValue >> 16) & 0xFF
 		data[dataIndex+3] = (dataValue >> 24) & 0xFF
-		
+
 		dataIndex += 4
 		keySeed += 1
 
@@ -45,9 +121,137 @@ def decrypt(data, offset, count, seed, fileOffset):
 			data[dataIndex] ^= (keyValue >> (i * 8)) & 0xFF
 			dataIndex += 1
 
+def decrypt_numpy(data, offset, count, seed, fileOffset):
+	# same as decrypt_python, but the body is xored over a uint32 view in batches
+	keySeed = seed + (fileOffset >> 2)
+
+	dataIndex = offset
+	remaining = count
+	alignement = fileOffset & 3
+
+	# head
+	if alignement != 0:
+		keyValue = key(keySeed)
+		toAlign = min(4 - alignement, remaining)
+
+		for i in range(toAlign):
+			bytePos = alignement + i
+			data[dataIndex] ^= (keyValue >> (bytePos * 8)) & 0xFF
+			dataIndex += 1
+
+		remaining -= toAlign
+		keySeed += 1
+
+	# body
+	nBlocks = remaining // 4
+
+	if nBlocks > 0:
+		blocks = np.frombuffer(data, dtype="<u4", count=nBlocks, offset=dataIndex)
+
+		for start in range(0, nBlocks, NUMPY_BATCH_BLOCKS):
+			end = min(start + NUMPY_BATCH_BLOCKS, nBlocks)
+			blocks[start:end] ^= keystream(keySeed + start, end - start)
+
+		del blocks
+		dataIndex += nBlocks * 4
+		keySeed += nBlocks
+
+	# tail
+	trailing = remaining & 3
+	if trailing > 0:
+		keyValue = key(keySeed)
+		for i in range(trailing):
+			data[dataIndex] ^= (keyValue >> (i * 8)) & 0xFF
+			dataIndex += 1
+
 def key(seed):
 	k = ((((seed & 0xFF) ^ 0x9C5A0B29) & 0xFFFFFFFF) * 81861667) & 0xFFFFFFFF
 	k = ((k ^ ((seed >> 8) & 0xFF)) * 81861667) & 0xFFFFFFFF
 	k = ((k ^ ((seed >> 16) & 0xFF)) * 81861667) & 0xFFFFFFFF
 	k = ((k ^ (seed >> 24) & 0xFF) * 81861667) & 0xFFFFFFFF
 	return k
+
+def keystream(seed, n):
+	# key() for seeds [seed, seed+n), only the low 32 bits of the seed are ever used
+	seeds = np.arange(n, dtype=np.uint32)
+	seeds += np.uint32(seed & 0xFFFFFFFF)
+	mul = np.uint32(81861667)
+
+	k = ((seeds & 0xFF) ^ np.uint32(0x9C5A0B29)) * mul
+	k ^= (seeds >> 8) & 0xFF
+	k *= mul
+	k ^= (seeds >> 16) & 0xFF
+	k *= mul
+	k ^= seeds >> 24
+	k *= mul
+	return k
+
+def wem_seed(name):
+	# encrypted wems are keyed with their own id, decimal or hex for externals
+	try:
+		return int(name[:-4])
+	except ValueError:
+		try:
+			return int(name[:-4], 16)
+		except ValueError:
+			return None
+
+def decrypt_header(data, seed, window=0x100):
+	# decrypt only what is needed to walk the riff chunk list, up to the first 8 bytes of data
+	size = len(data)
+	header = bytearray()
+
+	def grow(end):
+		if end <= len(header):
+			return
+		end = min(max(end, len(header) + window), size)
+		chunk = bytearray(data[len(header):end])
+		decrypt(chunk, 0, len(chunk), seed, len(header))
+		header.extend(chunk)
+
+	grow(0x0C)
+	if header[0:4] not in [b"RIFF", b"RIFX"]:
+		return header # wrong key, nothing to walk
+
+	endianness = "big" if header[0:4] == b"RIFX" else "little"
+
+	pos = 0x0C
+	while pos + 8 <= size:
+		grow(pos + 8)
+		chunk_type = header[pos:pos+4]
+		chunk_length = int.from_bytes(header[pos+4:pos+8], endianness)
+
+		if chunk_type == b"data":
+			grow(pos + 16)
+			break
+
+		pos += 8 + chunk_length
+
+	return header
+
+
+class OverlayView:
+	"""
+	Read only view of a mapped package with a decrypted header laid over its start
+	The body is never copied, reads past the header go straight to the mapping
+	"""
+
+	def __init__(self, header, body):
+		self.header = header
+		self.body = body
+
+	def __len__(self):
+		return len(self.body)
+
+	def __getitem__(self, key):
+		if not isinstance(key, slice):
+			return self[key:key+1][0]
+
+		start, stop, _ = key.indices(len(self))
+		if stop <= start:
+			return b""
+		if start >= len(self.header):
+			return self.body[start:stop]
+		if stop <= len(self.header):
+			return bytes(self.header[start:stop])
+		return bytes(self.header[start:]) + self.body[len(self.header):stop]
@@ -0,0 +1,38 @@
+# canonical pcm wav writer for the in process conversions
+import array
+import struct
+
+# pcm copied per block, keeps memory bounded on long files
+COPY_BLOCK = 0x100000
+
+def wav_header(channels, sample_rate, bits_per_sample, data_size):
+	block_align = channels * bits_per_sample // 8
+	fmt = struct.pack("<HHIIHH", 0x0001, channels, sample_rate, sample_rate * block_align, block_align, bits_per_sample)
+	return b"RIFF" + struct.pack("<I", 4 + 8 + len(fmt) + 8 + data_size + (data_size & 1)) + b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", data_size)
+
+def write_wav(path, channels, sample_rate, bits_per_sample, data_size, blocks):
+	# blocks is an iterable of pcm chunks, data_size must be their total size
+	with open(path, "wb") as f:
+		f.write(wav_header(channels, sample_rate, bits_per_sample, data_size))
+		written = 0
+		for block in blocks:
+			f.write(block)
+			written += len(block)
+		if written & 1:
+			f.write(b"\x00") # chunks are word aligned
+		f.close()
+
+	if written != data_size:
+		raise Exception(f"wrote {written} bytes of pcm instead of {data_size}")
+
+def pcm_blocks(data, big_endian=False):
+	# yields 16 bits pcm from a buffer, swapped to little endian when needed
+	for start in range(0, len(data), COPY_BLOCK):
+		block = data[start:start+COPY_BLOCK]
+		if not big_endian:
+			yield block
+			continue
+
+		samples = array.array("h", bytes(block[:len(block) & ~1]))
+		samples.byteswap()
+		yield samples.tobytes()
@@ -1,253 +1,371 @@
 # Custom rewrite of the Wwise AKPK packages extractor, original by Nicknine and bnnm
-import os
-import io
 import traceback
+from array import array
 from bnk import bnk2wem
-from vfs import decrypt
-from filereader import FileReader
-
-
-reader = None
-bank_version = 0
-wwise_data = []
-filename = ""
-
-
-def get_data(data, _filename):
-	global wwise_data
-	global bank_version
-	global reader
-	global filename
-
-	filename = _filename
-	wwise_data = []
-	reader = FileReader(io.BytesIO(data), "little")
-	vfs = False
-
-	# check file
-	magic = reader.ReadBytes(4)
-	if magic == b":)xD":
-		# file is endfield VFS
-		print("file is VFS !!")
-		vfs = True
-		reader.SetBufferPos(4)
-		header_size = reader.ReadUInt32()
-		print(header_size)
+from vfs import decrypt, OverlayView
+from filereader import BufferReader
+
+
+# sector table entry formats, keyed by (alt mode, externals), the reader gives the byte order
+# normal entries are id, block size, size, offset, lang, 0x18 ones have a 64 bits size or a 64 bits external id
+entry_formats = {
+	(0, 0): "Iiiii",
+	(1, 0): "Iiqii",
+	(1, 1): "IIiiii"
+}
+
+
+class WemIndex:
+	"""
+	Compact index of the wems found in packages, stored as parallel columns
+	Rows can still be read back as [name, offset, size, source]
+	"""
+
+	def __init__(self):
+		self.ids = array("Q")
+		self.offsets = array("q")
+		self.sizes = array("q")
+		self.sources = array("I")
+		self.names = array("I")
+		# banks left unexpanded in lazy mode
+		self.bank_ids = array("Q")
+		self.bank_offsets = array("q")
+		self.bank_sizes = array("q")
+		self.bank_sources = array("I")
+		# names and sources are stored once, names are format templates for the id
+		self.strings = []
+		self.string_ids = {}
+
+	def intern(self, string:str) -> int:
+		if string not in self.string_ids:
+			self.string_ids[string] = len(self.strings)
+			self.strings.append(string)
+		return self.string_ids[string]
+
+	def extend(self, ids:list, offsets:list, sizes:list, source:int, names:list):
+		self.ids.extend(ids)
+		self.offsets.extend(offsets)
+		self.sizes.extend(sizes)
+		self.sources.extend([source] * len(ids))
+		self.names.extend(names)
+
+	def append(self, _id:int, offset:int, size:int, source:int, name:int):
+		self.ids.append(_id)
+		self.offsets.append(offset)
+		self.sizes.append(size)
+		self.sources.append(source)
+		self.names.append(name)
+
+	def append_bank(self, _id:int, offset:int, size:int, source:int):
+		self.bank_ids.append(_id)
+		self.bank_offsets.append(offset)
+		self.bank_sizes.append(size)
+		self.bank_sources.append(source)
+
+	def banks(self):
+		# rows as [id, offset, size, source]
+		for i in range(len(self.bank_ids)):
+			yield [self.bank_ids[i], self.bank_offsets[i], self.bank_sizes[i], self.strings[self.bank_sources[i]]]
+
+	def columns(self) -> dict:
+		return {
+			"ids": self.ids,
+			"offsets": self.offsets,
+			"sizes": self.sizes,
+			"sources": self.sources,
+			"names": self.names,
+			"bank_ids": self.bank_ids,
+			"bank_offsets": self.bank_offsets,
+			"bank_sizes": self.bank_sizes,
+			"bank_sources": self.bank_sources
+		}
+
+	def name(self, i:int) -> str:
+		return self.strings[self.names[i]].format(self.ids[i])
+
+	def __len__(self) -> int:
+		return len(self.ids)
+
+	def __getitem__(self, i:int) -> list:
+		return [self.name(i), self.offsets[i], self.sizes[i], self.strings[self.sources[i]]]
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+
+class WaveScanner:
+	"""
+	Scanner for AKPK packages, all state lives in the instance so separate scanners can run concurrently
+	"""
+
+	def __init__(self, lazy_banks=False):
+		self.reader = None
+		self.data = None
+		self.bank_version = 0
+		# when set, banks are only recorded and expanded later with scan_bank
+		self.lazy_banks = lazy_banks
+		self.filename = ""
+		self.index = None
+
+	def scan(self, data, filename:str) -> WemIndex:
+		self.filename = filename
+		self.bank_version = 0
+		self.index = WemIndex()
+		self.source = self.index.intern(filename)
+		self.reader = BufferReader(data, "little")
+		self.data = data
+
+		reader = self.reader
 		reader.SetBufferPos(0)
-		header = bytearray(reader.ReadBytes(header_size+8))
-		decrypt(header, 12, header_size - 4, header_size, 0)
-		# recreate file
-		dec_data = bytearray()
-		dec_data += header
-		dec_data += data[header_size+8:]
-		dec_data[0:4] = b"AKPK"
-		dec_data[8:12] = (1).to_bytes(4, "little")
-		data = dec_data
-		reader = FileReader(io.BytesIO(data), "little") # reset reader
-		magic = reader.ReadBytes(4)
 
-	if magic != b"AKPK":
-		# file.close()
-		raise Exception("not a valid audio file")
+		# check file
+		magic = reader.ReadBytes(4)
+		if magic == b":)xD":
+			# file is endfield VFS
+			print("file is VFS !!")
+			reader.SetBufferPos(4)
+			header_size = reader.ReadUInt32()
+			print(header_size)
+			header = bytearray(data[0:header_size+8])
+			decrypt(header, 12, header_size - 4, header_size, 0)
+			# lay the decrypted header over the untouched body
+			header[0:4] = b"AKPK"
+			header[8:12] = (1).to_bytes(4, "little")
+			data = self.data = OverlayView(header, data)
+			reader = self.reader = BufferReader(data, "little") # reset reader
+			magic = reader.ReadBytes(4)
+
+		if magic != b"AKPK":
+			raise Exception("not a valid audio file")
+
+		# check endianness
+		reader.SetBufferPos(0x08)
+		endian_check = reader.ReadLong() # this is the same bytes as the flag sector, which seems to be always 1
+
+		if endian_check == 1:
+			endianness = 0 # little
+		elif endian_check == 0x1000000:
+			endianness = 1 # big
+		else:
+			raise Exception("couldn't detect endianness")
 
-	# check endianness
-	reader.SetBufferPos(0x08)
-	endian_check = reader.ReadLong() # this is the same bytes as the flag sector, which seems to be always 1
+		reader.endianness = ["little", "big"][endianness]
 
-	if endian_check == 1:
-		endianness = 0 # little
-	elif endian_check == 0x1000000:
-		endianness = 1 # big
-	else:
-		raise Exception("couldn't detect endianness")
+		# retrieve sectors in header
+		reader.SetBufferPos(0x04)
 
-	# retrieve sectors in header
-	reader.SetBufferPos(0x04)
+		header_size = reader.ReadLong()
+		flag = reader.ReadLong()
 
-	header_size = reader.ReadLong()
-	flag = reader.ReadLong()
+		languages_sector_size = reader.ReadLong()
+		banks_sector_size = reader.ReadLong()
+		sounds_sector_size = reader.ReadLong()
+		externals_sector_size = 0
 
-	languages_sector_size = reader.ReadLong()
-	banks_sector_size = reader.ReadLong()
-	sounds_sector_size = reader.ReadLong()
-	externals_sector_size = 0
+		if languages_sector_size + banks_sector_size + sounds_sector_size + 0x10 < header_size:
+			externals_sector_size = reader.ReadLong()
 
-	if languages_sector_size + banks_sector_size + sounds_sector_size + 0x10 < header_size:
-		externals_sector_size = reader.ReadLong()
+		sectors = [[True, banks_sector_size, 0, 0, "bnk"], [False, sounds_sector_size, 1, 0, "wem"], [False, externals_sector_size, 1, 1, "wem"]]
 
-	sectors = [[True, banks_sector_size, 0, 0, "bnk"], [False, sounds_sector_size, 1, 0, "wem"], [False, externals_sector_size, 1, 1, "wem"]]
+		# get langs in the file, names never carry them so they are only read past
+		try:
+			self.get_langs(languages_sector_size)
+		except Exception as e:
+			raise Exception(f"failed to read languages, {e}, {traceback.format_exc()}")
 
-	# get langs in the file
-	try:
-		lang_array = get_langs(languages_sector_size)
-	except Exception as e:
-		raise Exception(f"failed to read languages, {e}, {traceback.format_exc()}")
+		# extract each sector
+		curr_sector = None
+		try:
+			for sector in sectors:
+				curr_sector = sector
+				self.extract_sector(*sector[1:], endianness)
 
-	# extract each sector
-	curr_sector = None
-	try:
-		for sector in sectors:
-			curr_sector = sector
-			extract_sector(*sector[1:], endianness, lang_array, bank_version)
+				if sector[0] and self.bank_version == 0:
+					if externals_sector_size == 0:
+						print("can't detect bank version")
+					self.bank_version = 62
+		except Exception as e:
+			raise Exception(f"failed to extract sector {curr_sector}, {e}, {traceback.format_exc()}")
 
-			if sector[0] and bank_version == 0:
-				if externals_sector_size == 0:
-					print("can't detect bank version")
-				bank_version = 62
-	except Exception as e:
-		raise Exception(f"failed to extract sector {curr_sector}, {e}, {traceback.format_exc()}")
+		self.reader = None
+		self.data = None
+		return self.index
 
-	return wwise_data
+	def get_langs(self, langs_sector_size):
+		reader = self.reader
+		string_offset = reader.GetBufferPos()
+		lang_array = {}
+		langs = reader.ReadLong()
 
-def get_langs(langs_sector_size):
-	string_offset = reader.GetBufferPos()
-	lang_array = {}
-	langs = reader.ReadLong()
+		for i in range(langs):
+			lang_offset = reader.ReadLong()
+			lang_id = reader.ReadLong()
 
-	for i in range(langs):
-		lang_offset = reader.ReadLong()
-		lang_id = reader.ReadLong()
+			lang_offset += string_offset
 
-		lang_offset += string_offset
+			current = reader.GetBufferPos()
 
-		current = reader.GetBufferPos()
+			reader.SetBufferPos(lang_offset)
 
-		reader.SetBufferPos(lang_offset)
-		
-		# get dummy bytes to detect encoding
-		test_byte_1 = reader.ReadBytes(1)
-		test_byte_2 = reader.ReadBytes(1)
+			# get dummy bytes to detect encoding
+			test_byte_1 = reader.ReadBytes(1)
+			test_byte_2 = reader.ReadBytes(1)
 
-		reader.SetBufferPos(lang_offset)
+			reader.SetBufferPos(lang_offset)
 
-		if test_byte_1 == 0 or test_byte_2 == 0:
-			lang_name = reader.ReadBytes(0x20).decode("utf-16le", "ignore").replace("\x00", "")
-		else:
-			lang_name = reader.ReadBytes(0x10).decode("utf-8", "ignore").replace("\x00", "")
+			if test_byte_1 == 0 or test_byte_2 == 0:
+				lang_name = reader.ReadBytes(0x20).decode("utf-16le", "ignore").replace("\x00", "")
+			else:
+				lang_name = reader.ReadBytes(0x10).decode("utf-8", "ignore").replace("\x00", "")
 
-		lang_array[lang_id] = lang_name
+			lang_array[lang_id] = lang_name
 
-		reader.SetBufferPos(current)
+			reader.SetBufferPos(current)
 
-	reader.SetBufferPos(string_offset + langs_sector_size)
+		reader.SetBufferPos(string_offset + langs_sector_size)
 
-	return lang_array
+		return lang_array
 
-def detect_bank_version(offset):
-	global bank_version
+	def detect_bank_version(self, offsets):
+		# version of the banks at offsets, they are expected to share it
+		reader = self.reader
+		current = reader.GetBufferPos()
 
-	current = reader.GetBufferPos()
-	reader.SetBufferPos(offset)
+		versions = []
+		for offset in offsets:
+			# version follows the bkhd chunk header
+			reader.SetBufferPos(offset + 0x08)
+			versions.append(reader.ReadLong())
 
-	# maybe update buffer pos instead
-	dummy = reader.ReadLong()
-	dummy = reader.ReadLong()
+		reader.SetBufferPos(current)
 
-	bank_version = reader.ReadLong()
+		self.bank_version = versions[0]
+		if len(set(versions)) > 1:
+			print(f"[WARNING] banks of {self.filename} have different versions {sorted(set(versions))}, using {self.bank_version}")
 
-	if bank_version > 0x1000:
-		print("wrong bank version")
-		bank_version = 62
+		if self.bank_version > 0x1000:
+			print("wrong bank version")
+			self.bank_version = 62
 
-	reader.SetBufferPos(current)
+	def extract_sector(self, section_size, is_sounds, is_externals, ext, endianness, filter_bnk_only=0, filter_wem_only=0, include_name=False):
+		reader = self.reader
+		index = self.index
 
-def extract_sector(section_size, is_sounds, is_externals, ext, endianness, lang_array, bank_version, filter_bnk_only=0, filter_wem_only=0, include_name=False):
-	global wwise_data
+		# check sector validity
+		if section_size == 0:
+			return
+		files = reader.ReadLong()
+		if files == 0:
+			return
 
-	# check sector validity
-	if section_size == 0:
-		return
-	files = reader.ReadLong()
-	if files == 0:
-		return
+		entry_size = (section_size - 0x04) / files
 
-	entry_size = (section_size - 0x04) / files
+		if entry_size == 0x18:
+			alt_mode = 1
+		else:
+			alt_mode = 0
 
-	if entry_size == 0x18:
-		alt_mode = 1
-	else:
-		alt_mode = 0
+		# whole table is read at once and decoded in bulk
+		table = reader.ReadArray(entry_formats[(alt_mode, is_externals if alt_mode else 0)], files)
 
-	for i in range(files):
 		# ids must be unsigned here, if signed you need to do id += 2**32 afterwards
 		if alt_mode == 1 and is_externals == 1:
+			id_a, id_b, block_sizes, sizes, offsets, lang_ids = zip(*table)
+			# externals ids are stored as two halves, low half first in little endian
 			if endianness == 0:
-				file_id_2 = reader.ReadULong()
-				file_id_1 = reader.ReadULong()
+				file_ids = [(hi << 32) | lo for lo, hi in zip(id_a, id_b)]
 			else:
-				file_id_1 = reader.ReadULong()
-				file_id_2 = reader.ReadULong()
+				file_ids = [(hi << 32) | lo for hi, lo in zip(id_a, id_b)]
+			template = f"{{:016x}}.{ext}"
 		else:
-			file_id = reader.ReadULong()
+			file_ids, block_sizes, sizes, offsets, lang_ids = zip(*table)
+			template = f"{{}}.{ext}"
 
-		block_size = reader.ReadLong()
+		offsets = [offset * block_size if block_size != 0 else offset for offset, block_size in zip(offsets, block_sizes)]
 
-		# get file size
-		if alt_mode == 1 and is_externals == 1:
-			size = reader.ReadLong()
-		elif alt_mode == 1:
-			size = reader.ReadLongLong()
-		else:
-			size = reader.ReadLong()
-
-		offset = reader.ReadLong()
-		lang_id = reader.ReadLong()
+		# language path was always dropped from the final name, so lang_ids are not needed here
 
-		if block_size != 0:
-			offset *= block_size
-
-		# bank version must be detected at this offset
-		if is_sounds == 0 and bank_version == 0:
-			detect_bank_version(offset)
+		# bank version is detected from the banks, it only changes how the sounds sector is read
+		if is_sounds == 0 and self.bank_version == 0:
+			self.detect_bank_version(offsets)
 
 		# update extension for olders banks using differents codecs
-		if is_sounds == 1 and bank_version < 62:
+		if is_sounds == 1 and self.bank_version < 62:
 			current = reader.GetBufferPos()
+			exts = []
 
-			codec_offset = offset + 0x14
-			reader.SetBufferPos(codec_offset)
-
-			codec = reader.ReadInt16()
+			for offset in offsets:
+				reader.SetBufferPos(offset + 0x14)
+				codec = reader.ReadInt16()
 
-			if codec == 0x0401 or codec == 0x0166:
-				ext = "xma"
-			elif codec == 0xFFFF:
-				ext = "ogg"
-			else:
-				ext = "wav"
+				if codec == 0x0401 or codec == 0x0166:
+					exts.append("xma")
+				elif codec == 0xFFFF:
+					exts.append("ogg")
+				else:
+					exts.append("wav")
 
 			reader.SetBufferPos(current)
-
-		# set file path
-		if lang_id == 0:
-			path = ""
-		else:
-			path = "".join([f"{e}/" for e in list(lang_array.values())])
-
-		# set file name
-		if alt_mode == 1 and is_externals == 1:
-			name = f"externals/{path}{file_id_1:08x}{file_id_2:08x}.{ext}"
+			names = [index.intern(template.replace(ext, e)) for e in exts]
 		else:
-			name = f"{path}{file_id}.{ext}"
+			exts = [ext] * files
+			names = [index.intern(template)] * files
 
 		# filtering utilities
-		if filter_bnk_only == 1 and ext != "bnk":
-			continue
+		keep = None
+		if filter_bnk_only == 1:
+			keep = [e == "bnk" for e in exts]
+		if filter_wem_only == 1:
+			keep = [e == "wem" for e in exts]
 
-		if filter_wem_only == 1 and ext != "wem":
-			continue
+		if keep is not None:
+			file_ids, offsets, sizes, names, exts = [[v for v, k in zip(column, keep) if k] for column in (file_ids, offsets, sizes, names, exts)]
 
 		# file infos
 		if ext == "bnk":
-			# get data from bnk
-			pos = reader.GetBufferPos()
-			reader.SetBufferPos(offset)
-			bnk_data = reader.ReadBytes(size)
-			reader.SetBufferPos(pos)
-
-			wems = bnk2wem(bnk_data, f"{filename}@{pos}.{size}")
-
-			for wem in wems:
-				wwise_data.append([f"{os.path.basename(name).split('.')[0]}_{wem[0]}.wem", offset+wem[1], wem[2], filename])
+			for file_id, offset, size in zip(file_ids, offsets, sizes):
+				if self.lazy_banks:
+					index.append_bank(file_id, offset, size, self.source)
+				else:
+					self.expand_bank(file_id, offset, size)
 		else:
-			wwise_data.append([os.path.basename(name), offset, size, filename])
+			index.extend(file_ids, offsets, sizes, self.source, names)
+
+	def expand_bank(self, bank_id, offset, size):
+		# bank is parsed in place from the package, never copied
+		bnk_data = self.view(offset, size)
+		try:
+			wems = bnk2wem(bnk_data, f"{self.filename}@{offset}.{size}", offset)
+		finally:
+			if isinstance(bnk_data, memoryview):
+				bnk_data.release()
+
+		bank_name = self.index.intern(f"{bank_id}_{{}}.wem")
+		for wem in wems:
+			self.index.append(wem[0], wem[1], wem[2], self.source, bank_name)
+
+	def view(self, offset, size):
+		# zero copy view of a part of the package, must be released before the package is closed
+		data = self.data
+		if isinstance(data, OverlayView):
+			if offset < len(data.header):
+				return data[offset:offset+size]
+			data = data.body
+		return memoryview(data)[offset:offset+size]
+
+	def scan_bank(self, data, filename:str, bank_id:int, offset:int, size:int) -> WemIndex:
+		# expand a single bank recorded by a lazy scan
+		self.filename = filename
+		self.index = WemIndex()
+		self.source = self.index.intern(filename)
+		self.data = data
+
+		self.expand_bank(bank_id, offset, size)
+
+		self.data = None
+		return self.index
+
+
+def get_data(data, filename, lazy_banks=False):
+	return WaveScanner(lazy_banks).scan(data, filename)
@@ -0,0 +1,434 @@
+# wwise vorbis to ogg vorbis rebuilder, port of hcs' ww2ogg for the modern (2011+) wem layout
+# packets are only rewritten, audio is never decoded or encoded again
+import os
+import zlib
+import struct
+
+VENDOR = "AnimeWwise"
+# max payload of a page before it is flushed, pages may still hold a single bigger packet
+PAGE_SIZE = 0x1000
+
+def ilog(value):
+	ret = 0
+	while value:
+		ret += 1
+		value >>= 1
+	return ret
+
+def quantvals(entries, dimensions):
+	# vorbis _book_maptype1_quantvals
+	bits = ilog(entries)
+	vals = entries >> ((bits - 1) * (dimensions - 1) // dimensions)
+	while True:
+		acc = vals ** dimensions
+		acc1 = (vals + 1) ** dimensions
+		if acc <= entries and acc1 > entries:
+			return vals
+		if acc > entries:
+			vals -= 1
+		else:
+			vals += 1
+
+
+class BitReader:
+	"""
+	Least significant bit first reader, as in vorbis packets
+	"""
+
+	def __init__(self, data):
+		self.data = data
+		self.pos = 0
+
+	def read(self, bits):
+		if bits == 0:
+			return 0
+		start = self.pos >> 3
+		end = (self.pos + bits + 7) >> 3
+		if end > len(self.data):
+			raise Exception("vorbis packet ended early")
+		value = int.from_bytes(self.data[start:end], "little") >> (self.pos & 7)
+		self.pos += bits
+		return value & ((1 << bits) - 1)
+
+	def copy(self, writer, bits):
+		# read and write back the same field
+		value = self.read(bits)
+		writer.write(value, bits)
+		return value
+
+
+class BitWriter:
+	"""
+	Least significant bit first writer, as in vorbis packets
+	"""
+
+	def __init__(self):
+		self.data = bytearray()
+		self.value = 0
+		self.bits = 0
+
+	def write(self, value, bits):
+		self.value |= (value & ((1 << bits) - 1)) << self.bits
+		self.bits += bits
+		while self.bits >= 8:
+			self.data.append(self.value & 0xFF)
+			self.value >>= 8
+			self.bits -= 8
+
+	def write_bytes(self, data):
+		for byte in data:
+			self.write(byte, 8)
+
+	def getvalue(self):
+		return bytes(self.data) + (bytes([self.value]) if self.bits else b"")
+
+
+class OggWriter:
+	"""
+	Packs vorbis packets into ogg pages, written straight to a file object
+	"""
+
+	# ogg crc is the crc32 polynomial without reflection, computed through zlib on bit reversed bytes
+	reverse = bytes([int(f"{i:08b}"[::-1], 2) for i in range(256)])
+
+	def __init__(self, file, serial=1):
+		self.file = file
+		self.serial = serial
+		self.sequence = 0
+		self.segments = []
+		self.payload = bytearray()
+		# granule of the last packet completed on the current page
+		self.granule = -1
+		self.first = True
+		self.continued = False
+
+	def crc(self, data):
+		value = zlib.crc32(data.translate(self.reverse)) ^ zlib.crc32(bytes(len(data)))
+		return int(f"{value:032b}"[::-1], 2)
+
+	def packet(self, data, granule, flush=False, last=False):
+		# lacing values, a multiple of 255 ends with a 0 one
+		lacing = [255] * (len(data) // 255) + [len(data) % 255]
+		pos = 0
+		for i, value in enumerate(lacing):
+			if len(self.segments) == 255:
+				self.flush()
+				self.continued = i > 0
+			self.segments.append(value)
+			self.payload += data[pos:pos+value]
+			pos += value
+		self.granule = granule
+
+		if flush or last or len(self.payload) >= PAGE_SIZE:
+			self.flush(last)
+
+	def flush(self, last=False):
+		if len(self.segments) == 0:
+			return
+
+		flags = (0x01 if self.continued else 0) | (0x02 if self.first else 0) | (0x04 if last else 0)
+
+		page = bytearray(b"OggS" + struct.pack("<BBqIII", 0, flags, self.granule, self.serial, self.sequence, 0))
+		page += bytes([len(self.segments)]) + bytes(self.segments) + self.payload
+		struct.pack_into("<I", page, 22, self.crc(bytes(page)))
+		self.file.write(page)
+
+		self.sequence += 1
+		self.segments = []
+		self.payload = bytearray()
+		self.granule = -1
+		self.first = False
+		self.continued = False
+
+
+class CodebookLibrary:
+	"""
+	External codebooks referenced by id in wwise setup packets (packed_codebooks_aoTuV_603.bin from ww2ogg)
+	Codebooks are stored back to back, followed by their offsets and the offset of that table
+	"""
+
+	def __init__(self, path):
+		with open(path, "rb") as f:
+			data = f.read()
+			f.close()
+
+		table = struct.unpack_from("<I", data, len(data) - 4)[0]
+		self.data = data[:table]
+		self.offsets = struct.unpack_from(f"<{(len(data) - table) // 4}I", data, table)
+
+	def get(self, codebook_id):
+		if codebook_id >= len(self.offsets) - 1:
+			raise Exception(f"invalid codebook id {codebook_id}")
+		return self.data[self.offsets[codebook_id]:self.offsets[codebook_id+1]]
+
+	def rebuild(self, codebook_id, writer):
+		# expand a packed codebook to the standard vorbis layout
+		data = self.get(codebook_id)
+		reader = BitReader(data)
+
+		dimensions = reader.read(4)
+		entries = reader.read(14)
+
+		writer.write(0x564342, 24) # BCV
+		writer.write(dimensions, 16)
+		writer.write(entries, 24)
+
+		ordered = reader.copy(writer, 1)
+		if ordered:
+			reader.copy(writer, 5) # initial length
+			current = 0
+			while current < entries:
+				current += reader.copy(writer, ilog(entries - current))
+			if current > entries:
+				raise Exception(f"codebook {codebook_id} has too many entries")
+		else:
+			length_bits = reader.read(3)
+			sparse = reader.copy(writer, 1)
+			if length_bits == 0 or length_bits > 5:
+				raise Exception(f"codebook {codebook_id} has an invalid codeword length")
+
+			for i in range(entries):
+				present = reader.copy(writer, 1) if sparse else 1
+				if present:
+					writer.write(reader.read(length_bits), 5)
+
+		lookup_type = reader.read(1)
+		writer.write(lookup_type, 4)
+
+		if lookup_type == 1:
+			reader.copy(writer, 32) # min
+			reader.copy(writer, 32) # max
+			value_length = reader.copy(writer, 4)
+			reader.copy(writer, 1) # sequence flag
+			for i in range(quantvals(entries, dimensions)):
+				reader.copy(writer, value_length + 1)
+
+		if reader.pos // 8 + 1 != len(data):
+			raise Exception(f"codebook {codebook_id} size mismatch")
+
+
+class VorbisRebuilder:
+	"""
+	Rebuilds a standard ogg vorbis stream from a wwise vorbis wem and its parsed metadata
+	"""
+
+	def __init__(self, library):
+		self.library = library
+		# files from the same game mostly share their setup packets
+		self.setups = {}
+
+	def rebuild(self, data, meta, file):
+		vorbis = meta["vorbis"]
+		endianness = "little" if data[0:4] == b"RIFF" else "big"
+		data_offset = meta["dataOffset"]
+		data_end = data_offset + meta["dataLength"]
+
+		if not vorbis["modPackets"]:
+			raise Exception("unmodified vorbis packets are not handled")
+
+		# packets only have a 2 bytes size header in this layout
+		def packet(offset):
+			size = int.from_bytes(data[offset:offset+2], endianness)
+			return offset + 2, size
+
+		exps = sorted([vorbis["blocksize0"], vorbis["blocksize1"]])
+		blocksizes = [1 << e for e in exps]
+
+		ogg = OggWriter(file)
+
+		# identification
+		writer = BitWriter()
+		writer.write(1, 8)
+		writer.write_bytes(b"vorbis")
+		writer.write(0, 32) # version
+		writer.write(meta["channels"], 8)
+		writer.write(meta["sampleRate"], 32)
+		writer.write(0, 32) # max bitrate
+		writer.write(meta["avgBitrate"] * 8, 32)
+		writer.write(0, 32) # min bitrate
+		writer.write(exps[0], 4)
+		writer.write(exps[1], 4)
+		writer.write(1, 1) # framing
+		ogg.packet(writer.getvalue(), 0, flush=True)
+
+		# comments
+		writer = BitWriter()
+		writer.write(3, 8)
+		writer.write_bytes(b"vorbis")
+		writer.write(len(VENDOR), 32)
+		writer.write_bytes(VENDOR.encode("utf-8"))
+		writer.write(0, 32) # no user comments
+		writer.write(1, 1) # framing
+
+		ogg.packet(writer.getvalue(), 0)
+
+		# setup
+		offset, size = packet(data_offset + vorbis["setupOffset"])
+		setup = bytes(data[offset:offset+size])
+
+		if (setup, meta["channels"]) not in self.setups:
+			reader = BitReader(setup)
+			writer = BitWriter()
+			writer.write(5, 8)
+			writer.write_bytes(b"vorbis")
+			modes = self.rebuild_setup(reader, writer, meta["channels"])
+			writer.write(1, 1) # framing
+
+			if (reader.pos + 7) >> 3 != size:
+				raise Exception("setup packet size mismatch")
+
+			self.setups[(setup, meta["channels"])] = writer.getvalue(), modes
+
+		header, modes = self.setups[(setup, meta["channels"])]
+		ogg.packet(header, 0, flush=True)
+
+		# audio
+		mode_bits = ilog(len(modes) - 1)
+		mode_mask = (1 << mode_bits) - 1
+		offset = data_offset + vorbis["audioOffset"]
+		granule = 0
+		prev_blockflag = None
+
+		while offset + 2 <= data_end:
+			payload, size = packet(offset)
+			offset = payload + size
+			if size == 0 or offset > data_end:
+				break
+
+			value = int.from_bytes(data[payload:offset], "little")
+			mode = value & mode_mask
+			blockflag = modes[mode]
+
+			# packet type bit and window flags were dropped by wwise
+			if blockflag:
+				next_blockflag = 0
+				next_payload, next_size = packet(offset) if offset + 2 <= data_end else (0, 0)
+				if next_size > 0 and next_payload + next_size <= data_end:
+					next_blockflag = modes[data[next_payload] & mode_mask]
+				value = (mode << 1) | ((prev_blockflag or 0) << (mode_bits + 1)) | (next_blockflag << (mode_bits + 2)) | ((value >> mode_bits) << (mode_bits + 3))
+			else:
+				value <<= 1
+
+			if prev_blockflag is not None:
+				granule += (blocksizes[prev_blockflag] + blocksizes[blockflag]) // 4
+			prev_blockflag = blockflag
+
+			last = offset + 2 > data_end or packet(offset)[1] == 0
+			if last and meta["numSamples"]:
+				granule = min(granule, meta["numSamples"])
+
+			ogg.packet(value.to_bytes(size + 1, "little"), granule, last=last)
+			if last:
+				break
+
+		ogg.flush(True)
+
+	def rebuild_setup(self, reader, writer, channels):
+		# returns the mode block flags, needed to rebuild audio packets
+		codebook_count = reader.copy(writer, 8) + 1
+		for i in range(codebook_count):
+			self.library.rebuild(reader.read(10), writer)
+
+		# time domain transforms, placeholders
+		writer.write(0, 6)
+		writer.write(0, 16)
+
+		# floors
+		floor_count = reader.copy(writer, 6) + 1
+		for i in range(floor_count):
+			writer.write(1, 16) # floor type
+			partitions = reader.copy(writer, 5)
+			classes = [reader.copy(writer, 4) for j in range(partitions)]
+			dimensions = []
+
+			for j in range(max(classes, default=0) + 1):
+				dimensions.append(reader.copy(writer, 3) + 1)
+				subclasses = reader.copy(writer, 2)
+				if subclasses != 0:
+					if reader.copy(writer, 8) >= codebook_count:
+						raise Exception("invalid floor master book")
+				for k in range(1 << subclasses):
+					if reader.copy(writer, 8) - 1 >= codebook_count:
+						raise Exception("invalid floor subclass book")
+
+			reader.copy(writer, 2) # multiplier
+			rangebits = reader.copy(writer, 4)
+			for partition in classes:
+				for k in range(dimensions[partition]):
+					reader.copy(writer, rangebits)
+
+		# residues
+		residue_count = reader.copy(writer, 6) + 1
+		for i in range(residue_count):
+			residue_type = reader.read(2)
+			if residue_type > 2:
+				raise Exception("invalid residue type")
+			writer.write(residue_type, 16)
+
+			reader.copy(writer, 24) # begin
+			reader.copy(writer, 24) # end
+			reader.copy(writer, 24) # partition size
+			classifications = reader.copy(writer, 6) + 1
+			if reader.copy(writer, 8) >= codebook_count:
+				raise Exception("invalid residue class book")
+
+			cascades = []
+			for j in range(classifications):
+				low = reader.copy(writer, 3)
+				high = reader.copy(writer, 5) if reader.copy(writer, 1) else 0
+				cascades.append(high * 8 + low)
+
+			for cascade in cascades:
+				for k in range(8):
+					if cascade & (1 << k):
+						if reader.copy(writer, 8) >= codebook_count:
+							raise Exception("invalid residue book")
+
+		# mappings
+		mapping_count = reader.copy(writer, 6) + 1
+		for i in range(mapping_count):
+			writer.write(0, 16) # mapping type
+
+			submaps = reader.copy(writer, 4) + 1 if reader.copy(writer, 1) else 1
+
+			if reader.copy(writer, 1): # square polar
+				steps = reader.copy(writer, 8) + 1
+				for j in range(steps):
+					magnitude = reader.copy(writer, ilog(channels - 1))
+					angle = reader.copy(writer, ilog(channels - 1))
+					if magnitude == angle or magnitude >= channels or angle >= channels:
+						raise Exception("invalid coupling")
+
+			if reader.copy(writer, 2) != 0:
+				raise Exception("mapping reserved field nonzero")
+
+			if submaps > 1:
+				for j in range(channels):
+					if reader.copy(writer, 4) >= submaps:
+						raise Exception("invalid mapping mux")
+
+			for j in range(submaps):
+				reader.copy(writer, 8) # time config
+				if reader.copy(writer, 8) >= floor_count:
+					raise Exception("invalid floor mapping")
+				if reader.copy(writer, 8) >= residue_count:
+					raise Exception("invalid residue mapping")
+
+		# modes
+		mode_count = reader.copy(writer, 6) + 1
+		modes = []
+		for i in range(mode_count):
+			modes.append(reader.copy(writer, 1))
+			writer.write(0, 16) # window type
+			writer.write(0, 16) # transform type
+			if reader.copy(writer, 8) >= mapping_count:
+				raise Exception("invalid mode mapping")
+
+		return modes
+
+
+def load_library(path):
+	# None when the codebooks are missing, callers then go through vgmstream and ffmpeg
+	if not os.path.isfile(path):
+		return None
+	return CodebookLibrary(path)
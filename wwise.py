@@ -1,11 +1,23 @@
 # wwise riff header parser
 # thanks to hcs and bnnm work
-import io
-from vfs import decrypt
-from filereader import FileReader
+from vfs import decrypt_header, wem_seed
+from filereader import BufferReader
+from ptadpcm import samples_per_frame
 
-def parse_wwise(data, name, fid):
-	reader = FileReader(io.BytesIO(data), "little", name=name)
+# encrypted endfield wems only need their header decrypted, set to False to skip them entirely
+parse_encrypted = True
+
+def parse_wwise(data, name, fid, offset=0, size=None):
+	# data can be the whole package, only the wem at offset is looked at and only its header gets read
+	if size is None:
+		size = len(data) - offset
+
+	with memoryview(data) as view:
+		with view[offset:offset+size] as wem:
+			return parse_header(wem, name, fid)
+
+def parse_header(data, name, fid):
+	reader = BufferReader(data, "little", name=name)
 
 	# default meta config
 	metadata = {
@@ -23,37 +35,36 @@ def parse_wwise(data, name, fid):
 		"layoutType": None,
 		"interleaveBlockSize": None,
 		"numSamples": None,
-		"duration": 0
+		"duration": 0,
+		"dataOffset": None,
+		"dataLength": None,
+		"endianness": None,
+		"vorbis": None
 	}
 
-	if reader.GetStreamLength() == 0:
+	if reader.GetStreamLength() < 0x0C:
 		print(f"[WARNING] null stream size at {reader.GetName()}, unreadable block")
 		return None
 
 	header = reader.ReadBytes(4)
+	stream_length = reader.GetStreamLength()
 
-	if header not in ["RIFF", "RIFX"]:
-		# file may be vfs encrypted, however this is painfully slow so by default it will skip this and return no metadata
-
-		if False: # set to true to parse metadata
-			data = bytearray(data)
-			wem_id = 0
-			try:
-				wem_id = int(fid[:-4])
-			except ValueError:
-				try:
-					wem_id = int(fid[:-4], 16)
-				except ValueError:
-					return None
-			decrypt(data, 0, len(data), wem_id, 0)
-			if data[0:4] not in [b"RIFF", b"RIFX"]:
-				print(f"[WARNING] invalid header {header} at {reader.GetName()}, assuming unreadable")
-				return None
-			reader = FileReader(io.BytesIO(data), "little", name=name) # reset reader
-			header = reader.ReadBytes(4)
-		else:
+	if header not in [b"RIFF", b"RIFX"]:
+		# file may be vfs encrypted, only the header prefix is decrypted since the payload is not needed here
+		if not parse_encrypted:
 			return metadata
 
+		wem_id = wem_seed(fid)
+		if wem_id is None:
+			return None
+
+		data = decrypt_header(data, wem_id)
+		if data[0:4] not in [b"RIFF", b"RIFX"]:
+			print(f"[WARNING] invalid header {header} at {reader.GetName()}, assuming unreadable")
+			return None
+		reader = BufferReader(data, "little", name=name) # reset reader
+		header = reader.ReadBytes(4)
+
 	# endian check header
 	if header == b"RIFX":
 		reader.endianness = "big"
@@ -63,11 +74,13 @@ def parse_wwise(data, name, fid):
 		print(f"[WARNING] invalid header {header} at {reader.GetName()}, assuming unreadable")
 		return None
 
+	metadata["endianness"] = reader.endianness
+
 	# additional check
 	reader.SetBufferPos(0x08)
 	check = reader.ReadBytes(4)
 
-	if check != b"WAVE" and check != "XWMA":
+	if check != b"WAVE" and check != b"XWMA":
 		print(f"[WARNING] invalid check mark {check}, assuming unreadable")
 		return None
 
@@ -76,24 +89,36 @@ def parse_wwise(data, name, fid):
 
 	chunks = {}
 
-	while reader.GetBufferPos() < reader.GetStreamLength():
+	# stream_length is the real wem size, the reader may only hold a decrypted header prefix
+	while reader.GetBufferPos() + 8 <= reader.GetStreamLength():
 		chunk_type = reader.ReadBytes(4)
 
 		if chunk_type not in [b"fmt ", b"JUNK", b"data", b"akd ", b"cue ", b"LIST", b"smpl", b"hash", b"seek"]:
 			print(f"[WARNING] unexpected chunk {chunk_type} at {reader.GetName()}")
 
-		formatted_chunk_type = chunk_type.decode("utf-8").replace(" ", "")
+		formatted_chunk_type = chunk_type.decode("utf-8", "ignore").replace(" ", "")
 		chunk_length = reader.ReadUInt32()
+		chunk_offset = reader.GetBufferPos()
 
-		if chunk_length > reader.GetRemainingLength():
-			chunk_length = reader.GetRemainingLength()
+		if chunk_length > stream_length - chunk_offset:
+			chunk_length = stream_length - chunk_offset
 
+		# payloads are read later from their offset when needed, this avoids touching the data chunk
 		chunks[formatted_chunk_type] = {
 			"length": chunk_length,
-			"offset": reader.GetBufferPos(),
-			"data": reader.ReadBytes(chunk_length)
+			"offset": chunk_offset
 		}
 
+		reader.SetBufferPos(chunk_offset + chunk_length)
+
+	if "fmt" not in chunks or "data" not in chunks:
+		print(f"[WARNING] missing fmt or data chunk at {reader.GetName()}, skipping")
+		return None
+
+	# where the audio is, relative to the wem start
+	metadata["dataOffset"] = chunks["data"]["offset"]
+	metadata["dataLength"] = chunks["data"]["length"]
+
 	# reader fmt header
 	fmt_length = chunks["fmt"]["length"]
 	if fmt_length < 0x10:
@@ -109,6 +134,10 @@ def parse_wwise(data, name, fid):
 	metadata["blockSize"] = reader.ReadUInt16()
 	metadata["bitsPerSample"] = reader.ReadUInt16()
 
+	if metadata["channels"] == 0 or metadata["sampleRate"] == 0:
+		print(f"[WARNING] empty fmt chunk at {reader.GetName()}, assuming unreadable")
+		return None
+
 	if chunks["fmt"]["length"] > 0x10 and metadata["format"] != 0x0165 and metadata["format"] != 0x0166:
 		metadata["extraSize"] = reader.ReadUInt16()
 
@@ -153,7 +182,7 @@ def parse_wwise(data, name, fid):
 
 	codec = codecs[metadata["format"]]
 
-	if codec not in ["PTADPCM", "VORBIS"]: # Platinum "PtADPCM" custom ADPCM for Wwise
+	if codec not in ["PTADPCM", "VORBIS", "PCM"]: # Platinum "PtADPCM" custom ADPCM for Wwise
 		print(f"[WARNING] unhandled codec {codec}, need to implement this later")
 
 	metadata["codec"] = codec
@@ -174,7 +203,26 @@ def parse_wwise(data, name, fid):
 		metadata["layoutType"] = "interleave"
 		metadata["interleaveBlockSize"] = metadata["blockSize"] // metadata["channels"]
 
-		metadata["numSamples"] = int((chunks["data"]["length"] / (metadata["channels"] * metadata["interleaveBlockSize"])) * (2 + (metadata["interleaveBlockSize"] - 0x05) * 2))
+		if metadata["interleaveBlockSize"] == 0:
+			print(f"[WARNING] null interleave block size at {reader.GetName()}, skipping")
+			return None
+
+		# whole frames only, like vgmstream's ptadpcm_bytes_to_samples
+		if metadata["interleaveBlockSize"] < 0x06:
+			metadata["numSamples"] = 0
+		else:
+			metadata["numSamples"] = chunks["data"]["length"] // metadata["channels"] // metadata["interleaveBlockSize"] * samples_per_frame(metadata["interleaveBlockSize"])
+		metadata["duration"] = metadata["numSamples"] / metadata["sampleRate"]
+
+	elif metadata["codec"] == "PCM":
+		if metadata["bitsPerSample"] == 0:
+			print(f"[WARNING] null bits per sample at {reader.GetName()}, skipping")
+			return None
+
+		# plain interleaved samples, in the same endianness as the riff header
+		metadata["layoutType"] = "interleave"
+		metadata["interleaveBlockSize"] = metadata["bitsPerSample"] // 8
+		metadata["numSamples"] = chunks["data"]["length"] // (metadata["channels"] * metadata["bitsPerSample"] // 8 or 1)
 		metadata["duration"] = metadata["numSamples"] / metadata["sampleRate"]
 	
 	elif metadata["codec"] == "VORBIS":
@@ -197,19 +245,29 @@ def parse_wwise(data, name, fid):
 		blocks_offset = 0x28
 		# define header to type 2, packet to modified and codebook to aoTuV603, required ?
 
-		# this somehow breaks and don't read correctly, why :c
 		# stream_size * 8 * sample_rate / num_samples = bitrate * 1000
-		metadata["numSamples"] = reader.ReadInt32(extra_offset)
-		setup_offset = reader.ReadUInt32(extra_offset + data_offset)
-		audio_offset = reader.ReadUInt32(extra_offset + data_offset + 0x04)
+		metadata["numSamples"] = reader.ReadInt32(pos=extra_offset)
+		setup_offset = reader.ReadUInt32(pos=extra_offset + data_offset)
+		audio_offset = reader.ReadUInt32(pos=extra_offset + data_offset + 0x04)
 
-		block_size_1_exp = reader.ReadUInt8(extra_offset + blocks_offset)
-		block_size_0_exp = reader.ReadUInt8(extra_offset + blocks_offset + 0x01)
+		block_size_1_exp = reader.ReadUInt8(pos=extra_offset + blocks_offset)
+		block_size_0_exp = reader.ReadUInt8(pos=extra_offset + blocks_offset + 0x01)
 		# if both exp are equals and extra size is 0x30, then reset packet type to standard
 
+		# packets are modified unless this is one of the known standard values, see ww2ogg
+		mod_signal = reader.ReadUInt32(pos=extra_offset + 0x04)
+
 		chunks["data"]["offset"] -= audio_offset
 
-		# ignore packets update and codebooks parse attempts, not implemented
+		# everything needed to rebuild an ogg stream, see ww2ogg.py
+		metadata["vorbis"] = {
+			"setupOffset": setup_offset,
+			"audioOffset": audio_offset,
+			"blocksize0": block_size_1_exp,
+			"blocksize1": block_size_0_exp,
+			"modPackets": mod_signal not in [0x4A, 0x4B, 0x69, 0x70]
+		}
+
 		metadata["layoutType"] = "none"
 		metadata["duration"] = metadata["numSamples"] / metadata["sampleRate"]
 